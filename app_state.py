@@ -6,6 +6,8 @@ from pynput.keyboard import Controller
 app_state = {
     "main_mapping": {},            # 主映射字典（从 mapping1.json 加载）
     "alt_mapping": {},             # 副映射字典（从 mapping2.json 加载）
+    "main_keys": [None] * 128,     # 主映射的 [音符][力度] → 键名 查找表（由 mapping_manager 编译）
+    "alt_keys": [None] * 128,      # 副映射的查找表
     "current_mapping_name": "main",# 当前激活映射名："main" or "alt"
 
     "music_mode": True,            # 是否开启打字发音模式（预留）
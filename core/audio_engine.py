@@ -0,0 +1,240 @@
+# core/audio_engine.py
+"""
+独立进程音频引擎。
+
+音频播放、Qt 绘制与按键注入原本共享同一个 Python 进程与 GIL，
+一次较重的重绘或采样解码都可能拖慢 MIDI 线程上的按键注入。
+该模块把 mixer 与采样缓存放到子进程中：
+- MIDI 线程只向共享内存环形缓冲区写入 4 字节的音符命令（单生产者/单消费者，无锁）
+- 音频子进程轮询环形缓冲区并播放对应采样
+- 后台监护线程检测子进程崩溃并自动重启
+
+可直接运行 `python -m core.audio_engine` 对比进程内与独立进程两种方式的调用耗时。
+"""
+
+import multiprocessing
+import queue
+import struct
+import threading
+import time
+from multiprocessing import shared_memory
+
+# 命令类型
+CMD_NOTE_ON = 1
+CMD_NOTE_OFF = 2
+
+# 共享内存布局：头部为写指针(head)与读指针(tail)，各占 4 字节，其后为命令槽
+# 每个命令槽 4 字节：命令类型、音符号码、力度、保留字节
+HEADER = struct.Struct("<II")
+SLOT = struct.Struct("<BBBx")
+DEFAULT_CAPACITY = 1024  # 必须为 2 的幂，便于用位与取模
+
+POLL_INTERVAL = 0.001      # 子进程在缓冲区为空时的休眠间隔（秒）
+SUPERVISE_INTERVAL = 0.5   # 监护线程检查子进程存活的间隔（秒）
+RESTART_BASE_DELAY = 1.0   # 首次重启前的等待时间（秒），之后每次翻倍
+RESTART_MAX_DELAY = 30.0   # 重启等待时间上限（秒）
+MAX_RESTARTS = 5           # 连续重启失败的次数上限，超过后放弃独立进程
+STABLE_RUN_TIME = 30.0     # 子进程运行超过该时间视为稳定，连续重启计数清零
+
+# 子进程一律用 spawn 方式启动：fork 会复制父进程的 audio_player._engine 与 Qt/MIDI 线程持有的锁，
+# 导致子进程把切换音色命令转发回自己的控制队列，或在第一次 print 时死锁
+_mp = multiprocessing.get_context("spawn")
+
+
+class CommandRing:
+    """基于共享内存的单生产者/单消费者环形缓冲区
+
+    head 只由生产者写入、tail 只由消费者写入，两端都是对齐的 4 字节写，
+    因此无需加锁。缓冲区满时丢弃新命令而不是阻塞 MIDI 线程。
+    """
+
+    def __init__(self, name=None, capacity=DEFAULT_CAPACITY):
+        if capacity & (capacity - 1):
+            raise ValueError("capacity 必须为 2 的幂")
+        size = HEADER.size + capacity * SLOT.size
+        if name is None:
+            self.shm = shared_memory.SharedMemory(create=True, size=size)
+            HEADER.pack_into(self.shm.buf, 0, 0, 0)
+        else:
+            self.shm = shared_memory.SharedMemory(name=name)
+        self.name = self.shm.name
+        self.capacity = capacity
+        self.mask = capacity - 1
+        self.buf = self.shm.buf
+
+    def push(self, cmd, note, velocity=0):
+        # 生产者：写入命令槽后再推进 head，保证消费者看到 head 时数据已就绪
+        head, tail = HEADER.unpack_from(self.buf, 0)
+        if (head - tail) & 0xFFFFFFFF >= self.capacity:
+            return False
+        SLOT.pack_into(self.buf, HEADER.size + (head & self.mask) * SLOT.size, cmd, note, velocity)
+        struct.pack_into("<I", self.buf, 0, (head + 1) & 0xFFFFFFFF)
+        return True
+
+    def pop_all(self):
+        # 消费者：一次取出当前所有已就绪的命令
+        head, tail = HEADER.unpack_from(self.buf, 0)
+        commands = []
+        while tail != head:
+            commands.append(SLOT.unpack_from(self.buf, HEADER.size + (tail & self.mask) * SLOT.size))
+            tail = (tail + 1) & 0xFFFFFFFF
+        if commands:
+            struct.pack_into("<I", self.buf, 4, tail)
+        return commands
+
+    def skip_pending(self):
+        # 消费者重启时丢弃崩溃前残留的命令，避免一次性补播大量旧音符
+        head, _ = HEADER.unpack_from(self.buf, 0)
+        struct.pack_into("<I", self.buf, 4, head)
+
+    def close(self, unlink=False):
+        self.buf = None
+        self.shm.close()
+        if unlink:
+            self.shm.unlink()
+
+
+def _engine_main(ring_name, capacity, sound_pack_path, control):
+    # 音频子进程入口：持有 mixer 与采样缓存，循环消费命令
+    from core import audio_player
+
+    # 子进程自身就是播放端，确保 change_sound_pack 在本进程内重新加载采样而不是再次转发
+    audio_player._engine = None
+    audio_player.init_audio(sound_pack_path)
+    ring = CommandRing(ring_name, capacity)
+    ring.skip_pending()
+
+    try:
+        while True:
+            commands = ring.pop_all()
+            if commands:
+                for cmd, note, velocity in commands:
+                    if cmd == CMD_NOTE_ON:
+                        # 力度目前与进程内模式一致，仅随命令传递，预留给后续的力度音量
+                        sound = audio_player.AUDIO_CACHE.get(note)
+                        if sound:
+                            sound.play()
+                    # CMD_NOTE_OFF：钢琴采样自然衰减，暂不处理
+                continue
+
+            # 缓冲区为空时才检查低频的控制命令（切换音色/退出）
+            try:
+                message = control.get_nowait()
+            except queue.Empty:
+                time.sleep(POLL_INTERVAL)
+                continue
+            if message is None:
+                break
+            audio_player.change_sound_pack(message)
+    finally:
+        ring.close()
+
+
+class AudioEngine:
+    """独立音频进程的父进程端：负责写入命令、转发控制消息并监护子进程"""
+
+    def __init__(self, sound_pack_path, capacity=DEFAULT_CAPACITY, on_give_up=None):
+        self.sound_pack_path = sound_pack_path
+        self.ring = CommandRing(capacity=capacity)
+        self.control = _mp.Queue()
+        self.process = None
+        self.on_give_up = on_give_up  # 连续重启失败后调用，用于回退到进程内播放
+        self.restarts = 0
+        self._spawned_at = 0.0
+        self.dropped = 0
+        self._stopping = threading.Event()
+        self._supervisor = None
+
+    def start(self):
+        self._spawn()
+        self._supervisor = threading.Thread(target=self._supervise, name="AudioSupervisor", daemon=True)
+        self._supervisor.start()
+
+    def _spawn(self):
+        self.process = _mp.Process(
+            target=_engine_main,
+            args=(self.ring.name, self.ring.capacity, self.sound_pack_path, self.control),
+            name="MidiTypeAudio",
+            daemon=True,
+        )
+        self.process.start()
+        self._spawned_at = time.monotonic()
+
+    def _supervise(self):
+        # 子进程意外退出时按指数退避重启，新进程会使用当前的音色包；
+        # 连续失败超过 MAX_RESTARTS 次（如没有音频设备导致启动即崩溃）时放弃并回退
+        failures = 0
+        while not self._stopping.wait(SUPERVISE_INTERVAL):
+            if self.process.is_alive():
+                continue
+            if time.monotonic() - self._spawned_at >= STABLE_RUN_TIME:
+                failures = 0
+            failures += 1
+            if failures > MAX_RESTARTS:
+                print(f"❌ 音频进程连续 {MAX_RESTARTS} 次重启失败，停止使用独立音频进程")
+                self._stopping.set()
+                if self.on_give_up is not None:
+                    self.on_give_up()
+                return
+            delay = min(RESTART_BASE_DELAY * 2 ** (failures - 1), RESTART_MAX_DELAY)
+            print(f"⚠️ 音频进程已退出（exitcode={self.process.exitcode}），{delay:.0f} 秒后重启（第 {failures} 次）")
+            if self._stopping.wait(delay):
+                return
+            self.restarts += 1
+            self._spawn()
+
+    def note_on(self, note, velocity=127):
+        if not self.ring.push(CMD_NOTE_ON, note, velocity):
+            self.dropped += 1
+
+    def note_off(self, note):
+        if not self.ring.push(CMD_NOTE_OFF, note):
+            self.dropped += 1
+
+    def change_sound_pack(self, sound_pack_path):
+        self.sound_pack_path = sound_pack_path
+        self.control.put(sound_pack_path)
+
+    def stop(self):
+        self._stopping.set()
+        if self.process is not None and self.process.is_alive():
+            self.control.put(None)
+            self.process.join(timeout=2)
+            if self.process.is_alive():
+                self.process.terminate()
+        self.ring.close(unlink=True)
+
+
+def benchmark(iterations=2000, note=60):
+    """对比进程内 play_sound 与写入环形缓冲区的单次调用耗时（微秒）"""
+    from core import audio_player
+
+    audio_player.init_audio()
+    start = time.perf_counter()
+    for _ in range(iterations):
+        audio_player.play_sound(note)
+    in_process = (time.perf_counter() - start) / iterations * 1e6
+
+    engine = AudioEngine(audio_player.SOUNDS_DIR)
+    engine.start()
+    try:
+        time.sleep(1.0)  # 等待子进程加载采样
+        # 只累计写入命令本身的耗时；每批之间休眠以给消费者留出时间，休眠时长不计入结果
+        elapsed = 0.0
+        for i in range(0, iterations, 256):
+            start = time.perf_counter()
+            for _ in range(min(256, iterations - i)):
+                engine.note_on(note)
+            elapsed += time.perf_counter() - start
+            time.sleep(0.01)
+        pushed = elapsed / iterations * 1e6
+    finally:
+        engine.stop()
+
+    print(f"进程内 play_sound: {in_process:.1f} µs/次")
+    print(f"独立进程 note_on: {pushed:.1f} µs/次（丢弃 {engine.dropped} 条）")
+    return in_process, pushed
+
+
+if __name__ == "__main__":
+    benchmark()
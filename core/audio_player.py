@@ -2,15 +2,15 @@ import os
 import pygame
 from pprint import pprint
 
-# 初始化 pygame 的 mixer 模块
-pygame.mixer.init()
-
 # 全局音频缓存
 AUDIO_CACHE = {}
 
 # 音频文件所在目录
 SOUNDS_DIR = os.path.join("assets", "sounds", "piano_music")
 
+# 独立音频进程（由 init_audio 在 use_process=True 时创建），为 None 时在本进程内播放
+_engine = None
+
 # MIDI 音符号码 到 音符名称的映射
 # 以 C4 为中央 C (MIDI 号码 60)
 # 完整的音符列表: C, C#, D, D#, E, F, F#, G, G#, A, A#, B
@@ -48,6 +48,11 @@ def change_sound_pack(sound_pack_path):
     
     # 更新音频目录路径
     SOUNDS_DIR = sound_pack_path
+
+    # 独立音频进程模式下，采样缓存由音频进程持有，这里只转发切换命令
+    if _engine is not None:
+        _engine.change_sound_pack(sound_pack_path)
+        return True
     
     # 清空当前缓存
     AUDIO_CACHE = {}
@@ -103,8 +108,12 @@ def load_sounds():
     if AUDIO_CACHE:
         print(f"已加载MIDI号码范围: {min(AUDIO_CACHE.keys())} 到 {max(AUDIO_CACHE.keys())}")
 
-def play_sound(note):
+def play_sound(note, velocity=127):
     """播放指定MIDI号码的音符"""
+    engine = _engine
+    if engine is not None:
+        engine.note_on(note, velocity)
+        return
     sound = AUDIO_CACHE.get(note)
     if sound:
         sound.play()
@@ -112,10 +121,56 @@ def play_sound(note):
         note_name = midi_to_note_name(note)
         print(f"未找到MIDI音符 {note} ({note_name}) 对应的音频文件")
 
-# 初始化时加载音频文件
-load_sounds()
+def stop_sound(note):
+    """通知音符松开（进程内模式下采样自然衰减，无需处理）"""
+    engine = _engine
+    if engine is not None:
+        engine.note_off(note)
+
+def init_audio(sound_pack_path=None, use_process=False):
+    """初始化音频：在本进程内加载采样，或启动独立音频进程
+
+    use_process=True 时 mixer 与采样缓存都放在子进程中，
+    MIDI 线程只向共享内存环形缓冲区写入紧凑的音符命令。
+    """
+    global SOUNDS_DIR, _engine
+
+    if sound_pack_path and os.path.exists(sound_pack_path):
+        SOUNDS_DIR = sound_pack_path
+
+    if use_process:
+        from core.audio_engine import AudioEngine
+        _engine = AudioEngine(SOUNDS_DIR, on_give_up=_fallback_in_process)
+        _engine.start()
+        print(f"🔊 已启动独立音频进程: {SOUNDS_DIR}")
+        return
+
+    # 初始化 pygame 的 mixer 模块并加载音频文件
+    pygame.mixer.init()
+    load_sounds()
+
+    # 调试信息：打印部分映射关系
+    print("MIDI音符到音符名称示例:")
+    for i in range(60, 73):  # 从中央C (C4) 到 C5
+        print(f"MIDI {i} -> {midi_to_note_name(i)}")
+
+def _fallback_in_process():
+    """独立音频进程反复崩溃时回退到进程内播放；进程内也无法初始化时保持静音"""
+    global _engine
+    engine, _engine = _engine, None
+    try:
+        pygame.mixer.init()
+        load_sounds()
+        print("🔊 已回退到进程内音频播放")
+    except Exception as e:
+        print(f"⚠️ 无法初始化音频，音频反馈将保持静音: {e}")
+    # 采样加载完成后再释放环形缓冲区，此前仍在写入的 MIDI 线程不会访问到已关闭的共享内存
+    if engine is not None:
+        engine.stop()
 
-# 调试信息：打印部分映射关系
-print("MIDI音符到音符名称示例:")
-for i in range(60, 73):  # 从中央C (C4) 到 C5
-    print(f"MIDI {i} -> {midi_to_note_name(i)}")
+def shutdown_audio():
+    """关闭独立音频进程（若已启动）"""
+    global _engine
+    if _engine is not None:
+        _engine.stop()
+        _engine = None
@@ -0,0 +1,259 @@
+# core/completion.py
+"""
+单词补全：根据 handle_midi 输出的字符跟踪当前单词，给出候选词，并用一个钢琴键接受候选。
+
+- 候选来源：用户词表（每行 "单词" 或 "单词 次数"）与用户自己的输入历史
+- 索引：按字典序排列的单词列表 + 单词权重表 + 短前缀（不超过 TOP_PREFIX_LEN 个字母）的候选表。
+  短前缀直接查表，更长的前缀用二分查找定位到一个很小的区间再取权重最高的几个，单次查询在 1 毫秒以内
+- 索引预编译到 pickle 文件中，启动时直接加载；只有词表比索引新时才重新编译。
+  程序退出时把学到的输入历史与更新后的索引一起写回
+
+可运行 `python -m core.completion build [词表] [索引]` 手动编译索引。
+"""
+
+import heapq
+import json
+import os
+import pickle
+import threading
+import time
+from bisect import bisect_left, insort
+
+INDEX_VERSION = 1
+TOP_PREFIX_LEN = 3     # 不超过该长度的前缀预先计算候选表
+TOP_SIZE = 8           # 每个短前缀保存的候选数量
+SCAN_LIMIT = 2000      # 长前缀最多扫描的单词数量
+HISTORY_WEIGHT = 50    # 用户每输入一次某个单词增加的权重
+MIN_WORD_LEN = 2
+
+# 单词分隔键：结束当前单词并记入输入历史（单个标点字符同样视为分隔）
+SEPARATOR_KEYS = {"space", "enter", "return"}
+# 修饰键：不改变当前单词（如 shift + 字母输入大写）
+MODIFIER_KEYS = {"shift", "ctrl", "alt", "win", "capslock"}
+
+DEFAULT_WORDLIST = os.path.join("completion", "words.txt")
+DEFAULT_INDEX = os.path.join("completion", "words.idx")
+DEFAULT_HISTORY = os.path.join("completion", "history.json")
+
+# 全局补全实例，由 main.py 在启用补全时创建（为 None 表示未启用）
+engine = None
+
+
+def read_wordlist(path):
+    """读取词表，返回 {单词: 权重}；无次数的单词权重为 1"""
+    weights = {}
+    if not os.path.exists(path):
+        return weights
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            parts = line.split()
+            if not parts or parts[0].startswith("#"):
+                continue
+            word = parts[0].lower()
+            count = int(parts[1]) if len(parts) > 1 and parts[1].isdigit() else 1
+            weights[word] = weights.get(word, 0) + count
+    return weights
+
+
+def _top_words(candidates, weights, k):
+    return heapq.nlargest(k, candidates, key=lambda w: (weights[w], -len(w)))
+
+
+def build_index(weights):
+    """由 {单词: 权重} 编译出索引字典"""
+    words = sorted(weights)
+    buckets = {}
+    for word in words:
+        for n in range(1, min(len(word), TOP_PREFIX_LEN) + 1):
+            buckets.setdefault(word[:n], []).append(word)
+    top = {prefix: _top_words(bucket, weights, TOP_SIZE) for prefix, bucket in buckets.items()}
+    return {"version": INDEX_VERSION, "words": words, "weights": weights, "top": top}
+
+
+def compile_index(wordlist_path=DEFAULT_WORDLIST, index_path=DEFAULT_INDEX, history_path=DEFAULT_HISTORY):
+    """读取词表与输入历史，编译并写出索引文件"""
+    weights = read_wordlist(wordlist_path)
+    if os.path.exists(history_path):
+        with open(history_path, "r", encoding="utf-8") as f:
+            for word, count in json.load(f).items():
+                weights[word] = weights.get(word, 0) + count * HISTORY_WEIGHT
+    index = build_index(weights)
+    _write_index(index, index_path)
+    print(f"📚 补全索引已编译: {len(index['words'])} 个单词 → {index_path}")
+    return index
+
+
+def _write_index(index, index_path):
+    os.makedirs(os.path.dirname(index_path) or ".", exist_ok=True)
+    tmp_path = index_path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        pickle.dump(index, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp_path, index_path)
+
+
+def load_index(wordlist_path=DEFAULT_WORDLIST, index_path=DEFAULT_INDEX, history_path=DEFAULT_HISTORY):
+    """加载预编译索引；索引缺失、版本不符或词表更新时重新编译"""
+    stale = (not os.path.exists(index_path)
+             or (os.path.exists(wordlist_path) and os.path.getmtime(wordlist_path) > os.path.getmtime(index_path)))
+    if not stale:
+        try:
+            with open(index_path, "rb") as f:
+                index = pickle.load(f)
+            if index.get("version") == INDEX_VERSION:
+                return index
+        except Exception as e:
+            print(f"⚠️ 补全索引读取失败，重新编译: {e}")
+    return compile_index(wordlist_path, index_path, history_path)
+
+
+class Completer:
+    """跟踪当前单词并给出补全候选"""
+
+    def __init__(self, index, accept_note=None, max_suggestions=3, append_space=True,
+                 index_path=DEFAULT_INDEX, history_path=DEFAULT_HISTORY):
+        self.words = index["words"]
+        self.weights = index["weights"]
+        self.top = index["top"]
+        self.accept_note = accept_note
+        self.max_suggestions = max_suggestions
+        self.append_space = append_space
+        self.index_path = index_path
+        self.history_path = history_path
+        self.history = {}
+        if os.path.exists(history_path):
+            try:
+                with open(history_path, "r", encoding="utf-8") as f:
+                    self.history = json.load(f)
+            except Exception as e:
+                print(f"⚠️ 输入历史读取失败: {e}")
+        self.current = ""
+        self.suggestions = []
+        self._learned = False
+        # learn 在 MIDI 线程上修改索引，save 在 GUI 线程上（程序退出时）读取索引，由该锁串行化
+        self._lock = threading.Lock()
+
+    def lookup(self, prefix, k=None):
+        """返回以 prefix 开头、权重最高的 k 个单词（不含 prefix 本身）"""
+        k = k or self.max_suggestions
+        prefix = prefix.lower()
+        if not prefix:
+            return []
+        if len(prefix) <= TOP_PREFIX_LEN:
+            candidates = self.top.get(prefix, ())
+            return [w for w in candidates if w != prefix][:k]
+        lo = bisect_left(self.words, prefix)
+        hi = bisect_left(self.words, prefix + "\uffff", lo, min(lo + SCAN_LIMIT, len(self.words)))
+        candidates = [w for w in self.words[lo:hi] if w != prefix]
+        return _top_words(candidates, self.weights, k)
+
+    def on_key(self, keyname):
+        """根据发出的按键更新当前单词，返回新的候选列表
+
+        字母追加到当前单词；分隔键（空格、回车、标点）结束单词并学习；
+        修饰键不改变当前单词；方向键、Tab、Esc、数字等其他键放弃当前单词且不学习。
+        """
+        name = keyname.lower()
+        if len(keyname) == 1 and keyname.isalpha():
+            self.current += keyname
+        elif name == "backspace":
+            self.current = self.current[:-1]
+        elif name in MODIFIER_KEYS:
+            return self.suggestions
+        elif name in SEPARATOR_KEYS or (len(keyname) == 1 and not keyname.isalnum()):
+            self.commit()
+        else:
+            self.current = ""
+        return self._refresh()
+
+    def accept(self, keyboard, index=0):
+        """接受第 index 个候选：一次性输出剩余字符，返回输出的文本"""
+        if index >= len(self.suggestions):
+            return ""
+        word = self.suggestions[index]
+        text = word[len(self.current):]
+        if self.append_space:
+            text += " "
+        keyboard.type(text)
+        self.current = word
+        if self.append_space:
+            self.commit()
+        self._refresh()
+        return text
+
+    def commit(self):
+        # 单词结束：记入输入历史并重置
+        if len(self.current) >= MIN_WORD_LEN and self.current.isalpha():
+            self.learn(self.current)
+        self.current = ""
+
+    def learn(self, word):
+        word = word.lower()
+        with self._lock:
+            self.history[word] = self.history.get(word, 0) + 1
+            if word not in self.weights:
+                insort(self.words, word)
+                self.weights[word] = 0
+            self.weights[word] += HISTORY_WEIGHT
+            # 更新短前缀候选表
+            for n in range(1, min(len(word), TOP_PREFIX_LEN) + 1):
+                bucket = self.top.setdefault(word[:n], [])
+                if word not in bucket:
+                    bucket.append(word)
+                self.top[word[:n]] = _top_words(bucket, self.weights, TOP_SIZE)
+            self._learned = True
+
+    def _refresh(self):
+        self.suggestions = self.lookup(self.current) if self.current else []
+        return self.suggestions
+
+    def save(self):
+        # 程序退出时写回输入历史与更新后的索引，下次启动无需重新编译
+        # 退出时 MIDI 线程可能仍在学习新单词：先在锁内拷贝一份快照，再在锁外写文件
+        with self._lock:
+            if not self._learned:
+                return
+            history = dict(self.history)
+            index = {"version": INDEX_VERSION, "words": list(self.words), "weights": dict(self.weights),
+                     "top": {prefix: list(bucket) for prefix, bucket in self.top.items()}}
+            self._learned = False
+        try:
+            os.makedirs(os.path.dirname(self.history_path) or ".", exist_ok=True)
+            with open(self.history_path, "w", encoding="utf-8") as f:
+                json.dump(history, f, ensure_ascii=False)
+            _write_index(index, self.index_path)
+        except Exception as e:
+            self._learned = True  # 保存失败时保留未保存标记，便于再次调用 save 重试
+            print(f"❌ 补全数据保存失败: {e}")
+
+
+def init_completion(options):
+    """根据 config.json 中的 "completion" 配置创建全局补全实例"""
+    global engine
+    if not options.get("enabled", False):
+        return None
+    start = time.perf_counter()
+    wordlist_path = options.get("wordlist", DEFAULT_WORDLIST)
+    index_path = options.get("index", DEFAULT_INDEX)
+    history_path = options.get("history", DEFAULT_HISTORY)
+    index = load_index(wordlist_path, index_path, history_path)
+    engine = Completer(index,
+                       accept_note=options.get("accept_note"),
+                       max_suggestions=options.get("max_suggestions", 3),
+                       append_space=options.get("append_space", True),
+                       index_path=index_path,
+                       history_path=history_path)
+    print(f"📚 单词补全已启用：{len(engine.words)} 个单词，加载耗时 {(time.perf_counter() - start) * 1000:.1f} ms")
+    return engine
+
+
+def shutdown_completion():
+    if engine is not None:
+        engine.save()
+
+
+if __name__ == "__main__":
+    import sys
+    if len(sys.argv) >= 2 and sys.argv[1] == "build":
+        compile_index(*sys.argv[2:4])
+    else:
+        print(__doc__)
@@ -1,2 +1,77 @@
-# mapping_manager.py - autogenerated module stub
+# core/mapping_manager.py
+"""
+映射管理：把映射文件编译成按 MIDI 音符号码和力度直接下标访问的查找表。
 
+映射的值可以是：
+- 普通键名，如 "a"、"space"，与力度无关
+- 力度分层，如 {"soft": "a", "hard": "A"} 或 {"soft": "-", "hard": "_", "threshold": 100}，
+  力度达到 threshold（缺省时使用 config.json 中的 velocity_threshold）输出 hard，否则输出 soft
+
+build_key_table 生成长度为 128 的列表，每项为 None（无映射）或长度为 128 的键名元组，
+handle_midi 只需 table[note][velocity] 两次下标访问即可得到键名，不会因分层增加额外开销。
+"""
+
+DEFAULT_VELOCITY_THRESHOLD = 80
+
+
+def note_number(key):
+    """把映射中的键转为 0-127 的音符号码；非数字键（如 "_comment"）或超出范围时返回 None"""
+    try:
+        note = int(key)
+    except (TypeError, ValueError):
+        return None
+    return note if 0 <= note < 128 else None
+
+
+def resolve_layers(value, threshold=DEFAULT_VELOCITY_THRESHOLD):
+    """返回 (soft 键名, hard 键名, 阈值)；普通键名的 soft 与 hard 相同"""
+    if isinstance(value, dict):
+        soft = value.get("soft") or value.get("hard", "")
+        hard = value.get("hard") or soft
+        return soft, hard, int(value.get("threshold", threshold))
+    return value, value, threshold
+
+
+def build_key_table(mapping, threshold=DEFAULT_VELOCITY_THRESHOLD):
+    """把映射字典编译为 [音符][力度] → 键名 的查找表"""
+    table = [None] * 128
+    for key, value in mapping.items():
+        note = note_number(key)
+        if note is None:
+            continue
+        soft, hard, note_threshold = resolve_layers(value, threshold)
+        if not soft:
+            continue
+        note_threshold = min(max(note_threshold, 1), 128)
+        table[note] = (soft,) * note_threshold + (hard,) * (128 - note_threshold)
+    return table
+
+
+def build_label_table(mapping, symbols=None, threshold=DEFAULT_VELOCITY_THRESHOLD):
+    """生成用于界面显示的标签：{音符: (soft 标签, hard 标签)}，无分层时 hard 标签为空字符串"""
+    symbols = symbols or {}
+    labels = {}
+    for key, value in mapping.items():
+        note = note_number(key)
+        if note is None:
+            continue
+        soft, hard, _ = resolve_layers(value, threshold)
+        soft_label = symbols.get(soft.lower(), soft)
+        hard_label = symbols.get(hard.lower(), hard) if hard != soft else ""
+        labels[note] = (soft_label, hard_label)
+    return labels
+
+
+def note_range(mappings, extra_notes=(), default=(48, 84)):
+    """根据映射中出现的音符推导显示范围 (起始, 结束)，两端扩展到白键"""
+    notes = [n for n in (note_number(key) for mapping in mappings for key in mapping) if n is not None]
+    notes.extend(n for n in extra_notes if n is not None and 0 <= n < 128)
+    if not notes:
+        return default
+    start, end = min(notes), max(notes)
+    # 黑键不能作为键盘的首尾，向外扩展一个半音
+    if start % 12 in (1, 3, 6, 8, 10):
+        start -= 1
+    if end % 12 in (1, 3, 6, 8, 10):
+        end += 1
+    return start, end
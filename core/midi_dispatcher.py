@@ -10,6 +10,8 @@
 from app_state import app_state
 from utils.keycode_utils import get_key_obj, is_repeatable
 from core.repeater import start_repeat_thread, stop_repeat_thread
+import core.completion
+import core.state_bus
 
 # ✅ 引入共享 piano_overlay 实例
 # from gui.piano_overlay_instance import piano_overlay
@@ -19,12 +21,15 @@ import gui.piano_overlay_instance
 
 # 添加音频播放器导入（尝试导入，如果出错则忽略，以便在没有pygame的环境中也能运行）
 try:
-    from core.audio_player import play_sound
+    from core.audio_player import play_sound, stop_sound
 except ImportError:
     # 定义一个空函数，确保在没有音频模块时程序仍然可以运行
-    def play_sound(note):
+    def play_sound(note, velocity=127):
         print(f"音频模块未加载，无法播放音符 {note}")
 
+    def stop_sound(note):
+        pass
+
 note_to_key = {}
 
 def handle_midi(msg, repeat_enabled=True, repeat_delay=0.35, repeat_rate=10.0):
@@ -32,25 +37,43 @@ def handle_midi(msg, repeat_enabled=True, repeat_delay=0.35, repeat_rate=10.0):
     if msg.type == 'control_change' and msg.control == app_state["pedal_control"]:
         # ✅ 踏板切换主/副映射
         group = "alt" if msg.value >= 64 else "main"
+        if group == app_state["current_mapping_name"]:
+            return
         app_state["current_mapping_name"] = group
         print(f"🎮 踏板切换映射组 → {group}")
+        if core.state_bus.bus is not None:
+            core.state_bus.bus.set_layer(group)
 
         # ✅ 通知 piano_overlay 显示对应映射标注
         if gui.piano_overlay_instance.piano_overlay:
             print(f"🔁 调用 piano_overlay.set_label_group('{group}')")
             gui.piano_overlay_instance.piano_overlay.set_label_group(group)
 
-    # 处理按键按下：当收到 note_on 消息且 velocity 大于 0 时，查找当前映射中的对应键名，模拟键盘按下，并启动重复按键线程（若启用）
+    # 处理按键按下：当收到 note_on 消息且 velocity 大于 0 时，按音符与力度查找当前映射中的对应键名，模拟键盘按下，并启动重复按键线程（若启用）
     elif msg.type == 'note_on' and msg.velocity > 0:
-        mapping = app_state["main_mapping"] if app_state["current_mapping_name"] == "main" else app_state["alt_mapping"]
+        # 按 [音符][力度] 查预先编译的键名表（支持力度分层，见 core/mapping_manager.py）
+        table = app_state["main_keys"] if app_state["current_mapping_name"] == "main" else app_state["alt_keys"]
+        bands = table[msg.note]
         note = str(msg.note)
-        if note in mapping:
-            keyname = mapping[note]
+        completer = core.completion.engine
+        keyname = None
+        if completer is not None and msg.note == completer.accept_note:
+            # ✅ 补全接受键：一次性输出候选单词的剩余字符
+            try:
+                text = completer.accept(app_state["keyboard"])
+                print(f"📚 接受补全: {text!r}")
+            except Exception as e:
+                print(f"⚠️ 补全输出错误 → {e}")
+            update_suggestions(completer.suggestions)
+        elif bands is not None:
+            keyname = bands[msg.velocity]
             key = get_key_obj(keyname)
             try:
                 app_state["keyboard"].press(key)
                 note_to_key[note] = key
                 print(f"🔽 按下: {keyname}")
+                if completer is not None:
+                    update_suggestions(completer.on_key(keyname))
                 if repeat_enabled and is_repeatable(keyname):
                     start_repeat_thread(note, keyname, key, delay=repeat_delay, rate=repeat_rate)
             except Exception as e:
@@ -58,10 +81,14 @@ def handle_midi(msg, repeat_enabled=True, repeat_delay=0.35, repeat_rate=10.0):
         else:
             print(f"🎵 无映射: MIDI Note {note}")
 
+        # ✅ 发布到共享内存状态总线（keyname 为 None 表示该音符没有输出按键）
+        if core.state_bus.bus is not None:
+            core.state_bus.bus.note_on(msg.note, msg.velocity, keyname if note in note_to_key else None)
+
         # ✅ 如果音乐模式开启，播放对应的音符声音
         if app_state.get("music_mode", True):
             try:
-                play_sound(msg.note)  # 使用MIDI音符号码播放声音
+                play_sound(msg.note, msg.velocity)  # 使用MIDI音符号码播放声音
             except Exception as e:
                 print(f"⚠️ 播放音效失败: {e}")
 
@@ -85,9 +112,20 @@ def handle_midi(msg, repeat_enabled=True, repeat_delay=0.35, repeat_rate=10.0):
                 print(f"⚠️ 释放错误 {key}: {e}")
             del note_to_key[note]
 
+        if app_state.get("music_mode", True):
+            stop_sound(msg.note)
+
+        if core.state_bus.bus is not None:
+            core.state_bus.bus.note_off(msg.note)
+
         # ✅ 通知 piano_overlay 取消高亮该音符
         if gui.piano_overlay_instance.piano_overlay:
             print(f"🔕 调用 piano_overlay.note_off({msg.note})")
             gui.piano_overlay_instance.piano_overlay.note_off(msg.note)
         else:
             print("⚠️ piano_overlay 实例未设置")
+
+def update_suggestions(words):
+    # 通知 piano_overlay 显示补全候选
+    if gui.piano_overlay_instance.piano_overlay:
+        gui.piano_overlay_instance.piano_overlay.set_suggestions(words)
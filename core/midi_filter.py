@@ -0,0 +1,176 @@
+# core/midi_filter.py
+"""
+MIDI 消息预处理管线：在 handle_midi 之前过滤掉无需处理的消息。
+
+支持的阶段（均可在 config.json 的 "midi_filter" 中配置）：
+- types:          允许通过的消息类型，其余类型（时钟、aftertouch 等）直接丢弃
+- channels:       允许的 MIDI 通道列表（0-15），为 null 时不限制
+- min_velocity:   note_on 力度低于该值视为误触（幽灵音），整组按下/松开都被丢弃
+- debounce_ms:    同一音符松开后在该时间内再次按下视为触点抖动，整组按下/松开都被丢弃
+- controls:       允许的控制器编号列表，为 null 时不限制
+- cc_change_only: 控制器数值未变化时丢弃
+- cc_hysteresis:  控制器数值与上次放行的值相差小于该值时丢弃（0 和 127 两端、踏板跨过 64 时总会放行）
+
+已放行且尚未松开的音符，其重复按下即使被拒绝也不会吞掉之后的松开，避免按键卡住。
+
+build_pipeline 会根据配置只挑选启用的阶段，为每种消息类型生成一个检查函数，
+被拒绝的消息只需一次字典查找和少量比较，不会进入按键注入或界面更新。
+可运行 `python -m core.midi_filter` 执行自检。
+"""
+
+import time
+from types import SimpleNamespace
+
+DEFAULT_FILTER = {
+    "types": ["note_on", "note_off", "control_change"],
+    "channels": None,
+    "min_velocity": 1,
+    "debounce_ms": 0,
+    "controls": None,
+    "cc_change_only": True,
+    "cc_hysteresis": 0,
+}
+
+PEDAL_THRESHOLD = 64  # 与 handle_midi 切换映射组的阈值一致
+
+# 音符槽状态
+IDLE = 0        # 未按下
+HELD = 1        # 按下已放行，松开也需放行
+SUPPRESSED = 2  # 按下被丢弃，松开也需丢弃
+
+
+def _accept_all(msg):
+    return True
+
+
+def build_pipeline(options=None, pedal_control=None):
+    """根据配置生成 accept(msg) 函数，返回 True 表示消息应交给 handle_midi 处理
+
+    pedal_control 为切换映射组的踏板控制器编号，其数值跨过 PEDAL_THRESHOLD 时不受迟滞影响。
+    """
+    cfg = dict(DEFAULT_FILTER)
+    cfg.update(options or {})
+
+    channels = frozenset(cfg["channels"]) if cfg["channels"] is not None else None
+    min_velocity = max(int(cfg["min_velocity"]), 1)
+    debounce = cfg["debounce_ms"] / 1000.0
+    controls = frozenset(cfg["controls"]) if cfg["controls"] is not None else None
+    change_only = cfg["cc_change_only"]
+    hysteresis = int(cfg["cc_hysteresis"])
+
+    clock = time.perf_counter
+    # 以 通道*128+音符 为下标的状态表：音符槽状态（IDLE/HELD/SUPPRESSED）与最近一次松开的时间
+    state = bytearray(16 * 128)
+    released_at = [-1e9] * (16 * 128)
+    # 以 通道*128+控制器 为下标的最近一次放行的控制器数值，-1 表示尚未收到
+    last_cc = [-1] * (16 * 128)
+
+    def note_release(msg):
+        # note_off 与 velocity==0 的 note_on 共用的松开逻辑
+        slot = msg.channel * 128 + msg.note
+        if state[slot] == SUPPRESSED:
+            state[slot] = IDLE
+            return False
+        state[slot] = IDLE
+        if debounce:
+            released_at[slot] = clock()
+        return True
+
+    def note_on(msg):
+        if msg.velocity == 0:
+            return note_release(msg)
+        slot = msg.channel * 128 + msg.note
+        if msg.velocity < min_velocity or (debounce and clock() - released_at[slot] < debounce):
+            # 已放行的按下仍未松开时保持 HELD，确保其松开能够通过
+            if state[slot] != HELD:
+                state[slot] = SUPPRESSED
+            return False
+        state[slot] = HELD
+        return True
+
+    def control_change(msg):
+        if controls is not None and msg.control not in controls:
+            return False
+        slot = msg.channel * 128 + msg.control
+        value = msg.value
+        last = last_cc[slot]
+        if last >= 0:
+            if change_only and value == last:
+                return False
+            if (hysteresis and abs(value - last) < hysteresis and value not in (0, 127)
+                    and not (msg.control == pedal_control
+                             and (value >= PEDAL_THRESHOLD) != (last >= PEDAL_THRESHOLD))):
+                return False
+        last_cc[slot] = value
+        return True
+
+    stages = {}
+    for msg_type in cfg["types"]:
+        if msg_type == "note_on":
+            stages[msg_type] = note_on
+        elif msg_type == "note_off":
+            stages[msg_type] = note_release
+        elif msg_type == "control_change":
+            stages[msg_type] = control_change if (controls is not None or change_only or hysteresis) else _accept_all
+        else:
+            stages[msg_type] = _accept_all
+
+    # 不限制通道时省去通道判断，通道过滤只对带 channel 属性的消息生效
+    if channels is None:
+        def accept(msg):
+            stage = stages.get(msg.type)
+            return stage is not None and stage(msg)
+    else:
+        def accept(msg):
+            stage = stages.get(msg.type)
+            if stage is None:
+                return False
+            channel = getattr(msg, "channel", None)
+            return (channel is None or channel in channels) and stage(msg)
+
+    return accept
+
+
+def selftest():
+    """针对重复按下、踏板迟滞与去抖的自检，失败时抛出 AssertionError"""
+    def on(note, velocity, channel=0):
+        return SimpleNamespace(type="note_on", channel=channel, note=note, velocity=velocity)
+
+    def off(note, channel=0):
+        return SimpleNamespace(type="note_off", channel=channel, note=note, velocity=0)
+
+    def cc(control, value, channel=0):
+        return SimpleNamespace(type="control_change", channel=channel, control=control, value=value)
+
+    # 已按下的音符被一次低力度重复按下拒绝后，真正的松开仍然放行
+    accept = build_pipeline({"min_velocity": 10})
+    assert accept(on(60, 100)) is True
+    assert accept(on(60, 3)) is False
+    assert accept(off(60)) is True
+    # 未按下时被拒绝的按下，其松开同样被丢弃
+    assert accept(on(61, 3)) is False
+    assert accept(off(61)) is False
+    assert accept(on(61, 100)) is True and accept(off(61)) is True
+
+    # 迟滞不会吞掉踏板跨过阈值的变化，其他控制器照常过滤
+    accept = build_pipeline({"cc_hysteresis": 10}, pedal_control=64)
+    assert accept(cc(64, 60)) is True
+    assert accept(cc(64, 66)) is True
+    assert accept(cc(64, 62)) is True
+    assert accept(cc(64, 58)) is False
+    assert accept(cc(1, 60)) is True
+    assert accept(cc(1, 66)) is False
+
+    # 去抖：松开后立即再次按下被丢弃（连同其松开），超过去抖时间后恢复放行
+    accept = build_pipeline({"debounce_ms": 30})
+    assert accept(on(60, 100)) is True and accept(off(60)) is True
+    assert accept(on(60, 100)) is False
+    assert accept(off(60)) is False
+    time.sleep(0.05)
+    assert accept(on(60, 100)) is True and accept(off(60)) is True
+
+    print("✅ midi_filter 自检通过")
+
+
+if __name__ == "__main__":
+    selftest()
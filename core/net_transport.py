@@ -0,0 +1,361 @@
+# core/net_transport.py
+"""
+MIDI 网络传输：让 MIDI 键盘接在一台机器上，而在另一台机器上接收按键。
+
+- 发送端（NetSender / run_sender）：读取本地 MIDI 端口，把同时到达的事件合并成一个 UDP 包发出，
+  空闲时每隔 HEARTBEAT_INTERVAL 秒发送一次携带“当前按下音符位图”的心跳包；
+  接收端回送的确认包带有发送端自己的时间戳，据此统计往返延迟（RTT），不受两台机器时钟偏差影响
+- 接收端（NetReceiver）：按序号检测丢包、丢弃乱序旧包，把事件交给正常的分发流程并回送确认包；
+  心跳中未按下的音符会补发 note_off，超过 timeout 秒收不到任何包时为来自网络、仍按下的音符补发 note_off，
+  本地键盘按下的键不受影响。接收端只统计到达时间的抖动（相对于窗口内最快一包的额外传输时间）
+- 接收端只接受一个发送端的包：配置了 allowed_sender 时只接受该地址，否则锁定第一个发来有效包的地址；
+  无法解析的单个事件会被跳过，不会中断接收线程
+- 补发的 note_off 使用该音符按下时的通道，并交给 on_release（缺省为 on_message），
+  调用方可以让它绕过消息过滤，确保按键一定被释放
+
+包格式（网络字节序）：
+    头部 16 字节: 魔数 b"MT" | 标志 u8 | 事件数 u8 | 序号 u32 | 发送时间戳 u64（微秒）
+    事件 3 字节/个: 状态字节 | 数据1 | 数据2
+    若标志含 FLAG_HEARTBEAT，末尾附 16 字节的 128 位按下音符位图
+    确认包（FLAG_ACK）只有头部，序号与时间戳原样取自被确认的包
+
+运行方式：
+    python -m core.net_transport send <接收端地址> [端口]   # 在接 MIDI 键盘的机器上运行
+    python -m core.net_transport selftest                  # 本机回环测试，报告丢包、往返延迟与抖动
+"""
+
+import socket
+import struct
+import sys
+import threading
+import time
+from collections import deque
+
+DEFAULT_PORT = 9123
+HEARTBEAT_INTERVAL = 0.25
+DEFAULT_TIMEOUT = 1.0
+REPORT_INTERVAL = 60.0
+
+MAGIC = b"MT"
+FLAG_HEARTBEAT = 0x01
+FLAG_ACK = 0x02
+HEADER = struct.Struct("!2sBBIQ")
+EVENT_SIZE = 3
+MASK_SIZE = 16
+MAX_EVENTS = 255
+
+
+def _now_us():
+    return int(time.time() * 1_000_000)
+
+
+def encode_packet(seq, events, held_mask=None, timestamp=None, ack=False):
+    """把最多 255 个 3 字节事件编码为一个数据包；held_mask 不为 None 时附带按下音符位图"""
+    flags = (FLAG_HEARTBEAT if held_mask is not None else 0) | (FLAG_ACK if ack else 0)
+    parts = [HEADER.pack(MAGIC, flags, len(events), seq & 0xFFFFFFFF,
+                         _now_us() if timestamp is None else timestamp)]
+    parts.extend(events)
+    if held_mask is not None:
+        parts.append(held_mask.to_bytes(MASK_SIZE, "big"))
+    return b"".join(parts)
+
+
+def decode_packet(data):
+    """解码数据包，返回 (序号, 时间戳, 事件列表, 按下音符位图或 None)；格式不符时返回 None"""
+    if len(data) < HEADER.size:
+        return None
+    magic, flags, count, seq, timestamp = HEADER.unpack_from(data)
+    end = HEADER.size + count * EVENT_SIZE
+    if magic != MAGIC or len(data) < end:
+        return None
+    events = [data[i:i + EVENT_SIZE] for i in range(HEADER.size, end, EVENT_SIZE)]
+    held_mask = None
+    if flags & FLAG_HEARTBEAT and len(data) >= end + MASK_SIZE:
+        held_mask = int.from_bytes(data[end:end + MASK_SIZE], "big")
+    return seq, timestamp, events, held_mask
+
+
+class NetSender:
+    """UDP 发送端：批量发送事件，并在后台线程中定期发送心跳"""
+
+    def __init__(self, host, port=DEFAULT_PORT):
+        self.address = (host, port)
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.seq = 0
+        self.held_mask = 0
+        self._lock = threading.Lock()
+        self._last_send = 0.0
+        self._stopping = threading.Event()
+        self.rtts = deque(maxlen=1024)  # 最近的往返延迟（微秒）
+
+    def start(self, heartbeat=True):
+        threading.Thread(target=self._receive_acks, name="NetAck", daemon=True).start()
+        if heartbeat:
+            threading.Thread(target=self._heartbeat, name="NetHeartbeat", daemon=True).start()
+
+    def send_events(self, events):
+        # events 为 3 字节的原始 MIDI 消息，超过 255 个时拆成多个包
+        with self._lock:
+            for event in events:
+                status = event[0] & 0xF0
+                if status == 0x90 and event[2] > 0:
+                    self.held_mask |= 1 << event[1]
+                elif status in (0x80, 0x90):
+                    self.held_mask &= ~(1 << event[1])
+            for i in range(0, len(events), MAX_EVENTS):
+                self._send(events[i:i + MAX_EVENTS])
+
+    def _send(self, events, held_mask=None):
+        self.sock.sendto(encode_packet(self.seq, events, held_mask), self.address)
+        self.seq = (self.seq + 1) & 0xFFFFFFFF
+        self._last_send = time.perf_counter()
+
+    def _heartbeat(self):
+        while not self._stopping.wait(HEARTBEAT_INTERVAL / 2):
+            with self._lock:
+                if time.perf_counter() - self._last_send >= HEARTBEAT_INTERVAL:
+                    self._send([], self.held_mask)
+
+    def _receive_acks(self):
+        # 确认包中的时间戳由本机写入，直接相减即为往返延迟
+        while not self._stopping.is_set():
+            try:
+                data = self.sock.recv(64)
+            except OSError:
+                break
+            if len(data) < HEADER.size:
+                continue
+            magic, flags, _, _, timestamp = HEADER.unpack_from(data)
+            if magic == MAGIC and flags & FLAG_ACK:
+                self.rtts.append(_now_us() - timestamp)
+
+    def report(self):
+        if not self.rtts:
+            return "尚未收到接收端的确认包"
+        return f"已发送 {self.seq} 包；往返延迟 {_summary(self.rtts)}"
+
+    def close(self):
+        self._stopping.set()
+        self.sock.close()
+
+
+def _summary(samples):
+    ordered = sorted(samples)
+    avg = sum(ordered) / len(ordered)
+    p99 = ordered[min(len(ordered) - 1, int(len(ordered) * 0.99))]
+    return f"平均 {avg:.0f} µs / p99 {p99} µs / 最大 {ordered[-1]} µs"
+
+
+class NetReceiver:
+    """UDP 接收端：检测丢包、统计到达抖动、回送确认包，并把事件交给 on_message"""
+
+    def __init__(self, on_message, host="0.0.0.0", port=DEFAULT_PORT,
+                 timeout=DEFAULT_TIMEOUT, make_message=None, allowed_sender=None, on_release=None):
+        self.on_message = on_message
+        self.on_release = on_release or on_message
+        self.peer = allowed_sender  # 允许的发送端 IP，为 None 时锁定第一个发送端
+        self.timeout = timeout
+        if make_message is None:
+            import mido
+            make_message = mido.Message.from_bytes
+        self.make_message = make_message
+
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sock.bind((host, port))
+        self.sock.settimeout(timeout)
+        self.address = self.sock.getsockname()
+
+        self.expected_seq = None
+        self.held_mask = 0
+        self.note_channel = bytearray(128)  # 每个网络按下音符所在的 MIDI 通道
+        self.packets = 0
+        self.lost = 0
+        self.stale = 0
+        self.timeouts = 0
+        self.rejected = 0  # 来自其他地址的包
+        self.invalid = 0   # 无法解析或处理失败的事件
+        self.transits = deque(maxlen=1024)  # 最近的单向传输时间（微秒），含两台机器的时钟偏差，只用于计算抖动
+        self._stopping = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="NetReceiver", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stopping.set()
+        self.sock.close()
+        if self._thread is not None:
+            self._thread.join(timeout=self.timeout + 1)
+
+    def _run(self):
+        print(f"🌐 正在监听网络 MIDI: {self.address[0]}:{self.address[1]}")
+        last_report = time.perf_counter()
+        while not self._stopping.is_set():
+            try:
+                data, sender = self.sock.recvfrom(2048)
+            except socket.timeout:
+                self._handle_timeout()
+                continue
+            except OSError:
+                break
+            self._handle_packet(data, sender)
+            if time.perf_counter() - last_report >= REPORT_INTERVAL:
+                print(f"🌐 {self.report()}")
+                last_report = time.perf_counter()
+
+    def _handle_timeout(self):
+        # 长时间收不到包（发送端退出或网络中断）时，为来自网络、仍按下的音符补发 note_off；
+        # 本地键盘按下的键不经过这里，不会被释放
+        if self.held_mask:
+            self.timeouts += 1
+            print("⚠️ 网络 MIDI 超时，释放来自网络的按键")
+            self._release(self.held_mask)
+        self.expected_seq = None
+
+    def _release(self, mask):
+        note = 0
+        while mask:
+            if mask & 1:
+                self.held_mask &= ~(1 << note)
+                self._deliver(bytes((0x80 | self.note_channel[note], note, 0)), self.on_release)
+            mask >>= 1
+            note += 1
+
+    def _handle_packet(self, data, sender=None):
+        packet = decode_packet(data)
+        if packet is None:
+            return
+        seq, timestamp, events, held_mask = packet
+        if sender is not None:
+            if self.peer is None:
+                self.peer = sender[0]
+                print(f"🌐 已锁定网络 MIDI 发送端: {self.peer}")
+            elif sender[0] != self.peer:
+                # 其他主机发来的包不能变成本机的按键
+                self.rejected += 1
+                return
+            # 回送确认包，发送端据此用自己的时钟计算往返延迟
+            try:
+                self.sock.sendto(encode_packet(seq, [], timestamp=timestamp, ack=True), sender)
+            except OSError:
+                pass
+        if self.expected_seq is not None:
+            gap = (seq - self.expected_seq) & 0xFFFFFFFF
+            if gap >= 0x80000000:
+                # 比已处理的包更旧（乱序到达），直接丢弃
+                self.stale += 1
+                return
+            self.lost += gap
+        self.expected_seq = (seq + 1) & 0xFFFFFFFF
+        self.packets += 1
+        self.transits.append(_now_us() - timestamp)
+
+        for event in events:
+            # 状态字节最高位为 1、数据字节最高位为 0，否则不是合法的 3 字节通道消息
+            if event[0] < 0x80 or event[1] > 0x7F or event[2] > 0x7F:
+                self.invalid += 1
+                continue
+            status = event[0] & 0xF0
+            if status == 0x90 and event[2] > 0:
+                self.held_mask |= 1 << event[1]
+                self.note_channel[event[1]] = event[0] & 0x0F
+            elif status in (0x80, 0x90):
+                self.held_mask &= ~(1 << event[1])
+            self._deliver(event, self.on_message)
+
+        if held_mask is not None:
+            # 心跳对账：本地仍按下、但发送端已松开的音符（对应的 note_off 包丢失），补发 note_off
+            self._release(self.held_mask & ~held_mask)
+
+    def _deliver(self, event, handler):
+        # 单个事件解析或处理失败时跳过，保证接收线程与超时释放继续工作
+        try:
+            message = self.make_message(event)
+        except Exception as e:
+            self.invalid += 1
+            print(f"⚠️ 无法解析的网络 MIDI 事件 {event.hex()}: {e}")
+            return
+        try:
+            handler(message)
+        except Exception as e:
+            self.invalid += 1
+            print(f"❌ 网络 MIDI 事件处理失败: {e}")
+
+    def report(self):
+        if not self.transits:
+            return "尚未收到网络 MIDI 数据包"
+        # 两台机器的时钟偏差对每个包都相同，减去窗口内的最小传输时间即可消去
+        fastest = min(self.transits)
+        return (f"收包 {self.packets}，丢包 {self.lost}，乱序 {self.stale}，超时释放 {self.timeouts}，"
+                f"拒收 {self.rejected}，无效事件 {self.invalid}；"
+                f"到达抖动 {_summary([t - fastest for t in self.transits])}")
+
+
+def run_sender(host, port=DEFAULT_PORT, port_name=None):
+    """读取本地 MIDI 输入并转发到接收端；同时到达的事件合并到同一个包"""
+    import mido
+
+    names = mido.get_input_names()
+    if not names:
+        print("❌ 未找到 MIDI 输入设备")
+        return
+    port_name = port_name or names[0]
+    sender = NetSender(host, port)
+    sender.start()
+    print(f"🎧 正在转发 MIDI 设备 {port_name} → {host}:{port}")
+    last_report = time.perf_counter()
+    try:
+        with mido.open_input(port_name) as inport:
+            for msg in inport:
+                if time.perf_counter() - last_report >= REPORT_INTERVAL:
+                    print(f"🌐 {sender.report()}")
+                    last_report = time.perf_counter()
+                batch = [msg]
+                batch.extend(inport.iter_pending())
+                # 只转发 3 字节的通道消息（音符、控制器），忽略时钟、SysEx 等
+                events = [bytes(m.bytes()) for m in batch
+                          if m.type in ("note_on", "note_off", "control_change")]
+                if events:
+                    sender.send_events(events)
+    finally:
+        sender.close()
+
+
+def selftest(count=500, batch=3, interval=0.002):
+    """本机回环测试：按演奏节奏每 interval 秒发送一个包，报告丢包、往返延迟与抖动，并验证超时释放"""
+    released = threading.Event()
+    received = []
+
+    def on_message(event):
+        received.append(event)
+        if event == bytes((0x80, 100, 0)):
+            released.set()
+
+    receiver = NetReceiver(on_message, host="127.0.0.1", port=0, timeout=0.5, make_message=bytes)
+    receiver.start()
+    sender = NetSender(*receiver.address)
+    sender.start(heartbeat=False)  # 不发送心跳，以便模拟发送端失联
+    for i in range(count):
+        note = 36 + i % 48
+        sender.send_events([bytes((0x90, note, 100))] * (batch - 1) + [bytes((0x80, note, 0))])
+        time.sleep(interval)
+    sender.send_events([bytes((0x90, 100, 100))])  # 保持一个按下的音符（不在上面循环的音符范围内），然后静默等待超时
+    released.wait(timeout=2.0)
+    sender.close()
+    receiver.stop()
+
+    print(f"回环测试: 发送 {count + 1} 包 / 收到 {len(received)} 个事件")
+    print(receiver.report())
+    print(sender.report())
+    print(f"超时释放: {'✅ 已触发' if released.is_set() else '❌ 未触发'}")
+    return receiver
+
+
+if __name__ == "__main__":
+    if len(sys.argv) >= 3 and sys.argv[1] == "send":
+        run_sender(sys.argv[2], int(sys.argv[3]) if len(sys.argv) > 3 else DEFAULT_PORT)
+    elif len(sys.argv) >= 2 and sys.argv[1] == "selftest":
+        selftest()
+    else:
+        print(__doc__)
@@ -18,7 +18,7 @@ def start_repeat_thread(note, keyname, key_obj, delay=0.35, rate=10.0):
             app_state["keyboard"].release(key_obj)
             time.sleep(interval)
 
-    t = threading.Thread(target=repeater, daemon=True)
+    t = threading.Thread(target=repeater, name=f"Repeat-{note}", daemon=True)
     app_state["repeat_threads"][note] = t
     t.start()
 
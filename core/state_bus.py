@@ -0,0 +1,252 @@
+# core/state_bus.py
+"""
+共享内存状态总线：把 MidiType 的实时状态发布到一个内存映射文件中，供 OBS 叠加层、直播小组件、监控工具读取。
+
+外部工具只需映射同一个文件并按固定布局读取，无需 IPC 或套接字，可按任意频率轮询；
+发布端每个事件只做少量写入。读写一致性由 seqlock 保证：
+写入前把 seq 加 1（变为奇数），写完再加 1（变为偶数）；
+读取方在前后两次读到相同的偶数 seq 时，中间拷贝的数据才是完整的。
+
+文件布局（小端序，共 STATE_SIZE 字节）：
+    0   魔数 b"MTSB" | 版本 u16 | 事件槽数 u16
+    8   seq u32
+    12  当前映射组 u8（0=main，1=alt）| 保留 3 字节
+    16  按下音符位图：低 64 位 u64 | 高 64 位 u64
+    32  计数器：note_on u64 | note_off u64 | 按键输出 u64 | 映射组切换 u64
+    64  已写入事件总数 u64（最新事件位于 (总数-1) % 事件槽数）
+    72  事件环：每个事件 24 字节 = 时间戳 u64（微秒）| 类型 u8 | 音符 u8 | 力度 u8 | 保留 u8 | 键名 12 字节
+        （UTF-8，不足补 0；超长时在字符边界处截断，"backspace"、"capslock" 等键名可完整保存）
+
+发布端启动时不会截断已存在的文件（读取方可能仍映射着它），只在大小不符时扩展，
+并在 seqlock 保护下清空旧内容，读取方会看到 seq 变化后的全新状态。
+
+事件中包含最近输出的按键（可能是密码），因此状态文件默认放在当前用户私有的目录中
+（Windows 为 %LOCALAPPDATA%\\MidiType，其他系统为 $XDG_RUNTIME_DIR/MidiType 或 ~/.cache/MidiType），
+以 0600 权限创建，并拒绝打开符号链接或不属于当前用户的文件。
+
+该文件不依赖程序其他模块，外部工具可以单独拷贝使用其中的 StateBusReader。
+运行 `python -m core.state_bus [文件路径]` 可查看示例读取器的输出。
+"""
+
+import mmap
+import os
+import stat
+import struct
+import sys
+import threading
+import time
+
+MAGIC = b"MTSB"
+VERSION = 2
+EVENT_SLOTS = 32
+KEY_SIZE = 12
+
+EVENT_NOTE_ON = 1
+EVENT_NOTE_OFF = 2
+EVENT_LAYER = 3
+
+PREAMBLE = struct.Struct("<4sHH")
+SEQ = struct.Struct("<I")
+BODY = struct.Struct("<B3xQQQQQQQ")   # 映射组、位图、计数器与事件总数（偏移 12 起）
+EVENT = struct.Struct(f"<QBBBx{KEY_SIZE}s")
+SEQ_OFFSET = 8
+BODY_OFFSET = 12
+EVENTS_OFFSET = 72
+STATE_SIZE = EVENTS_OFFSET + EVENT_SLOTS * EVENT.size
+
+LAYERS = ("main", "alt")
+MASK64 = (1 << 64) - 1
+
+
+
+def _user_state_dir():
+    # 每个用户独立的目录，避免其他本地用户读取按键记录或预先放置符号链接
+    if os.name == "nt":
+        base = os.environ.get("LOCALAPPDATA") or os.path.expanduser("~")
+    else:
+        base = os.environ.get("XDG_RUNTIME_DIR") or os.path.join(os.path.expanduser("~"), ".cache")
+    return os.path.join(base, "MidiType")
+
+
+DEFAULT_PATH = os.path.join(_user_state_dir(), "state.bin")
+
+# 全局发布实例，由 main.py 在启用状态总线时创建（为 None 表示未启用）
+bus = None
+
+
+def _now_us():
+    return int(time.time() * 1_000_000)
+
+
+def _encode_key(keyname):
+    # 按字节截断后丢弃被截断的半个 UTF-8 字符
+    data = keyname.encode("utf-8")
+    if len(data) <= KEY_SIZE:
+        return data
+    return data[:KEY_SIZE].decode("utf-8", "ignore").encode("utf-8")
+
+
+class StateBusPublisher:
+    """状态发布端：单一写入者，多线程调用时由内部锁串行化"""
+
+    def __init__(self, path=DEFAULT_PATH):
+        self.path = path
+        os.makedirs(os.path.dirname(os.path.abspath(path)), mode=0o700, exist_ok=True)
+        # 没有 O_NOFOLLOW 的系统（Windows）上先检查路径本身是否为符号链接
+        if os.path.islink(path):
+            raise OSError(f"拒绝打开符号链接: {path}")
+        # 不能用 "wb" 打开：截断仍被读取方映射的文件会导致其访问越界（Linux 上为 SIGBUS，Windows 上无法截断）
+        flags = os.O_RDWR | os.O_CREAT | getattr(os, "O_BINARY", 0) | getattr(os, "O_NOFOLLOW", 0)
+        self._fd = os.open(path, flags, 0o600)
+        try:
+            info = os.fstat(self._fd)
+            if not stat.S_ISREG(info.st_mode):
+                raise OSError(f"状态文件不是普通文件: {path}")
+            if hasattr(os, "getuid"):
+                if info.st_uid != os.getuid():
+                    raise OSError(f"状态文件不属于当前用户: {path}")
+                if stat.S_IMODE(info.st_mode) & 0o077:
+                    os.fchmod(self._fd, 0o600)
+            if info.st_size != STATE_SIZE:
+                os.ftruncate(self._fd, STATE_SIZE)
+            self.buf = mmap.mmap(self._fd, STATE_SIZE)
+        except OSError:
+            os.close(self._fd)
+            raise
+
+        # 沿用旧文件中的 seq，在 seqlock 保护下清空上一次运行留下的状态
+        magic, _, _ = PREAMBLE.unpack_from(self.buf, 0)
+        seq = SEQ.unpack_from(self.buf, SEQ_OFFSET)[0] if magic == MAGIC else 0
+        self.seq = (seq + 1) & ~1 & 0xFFFFFFFF
+        SEQ.pack_into(self.buf, SEQ_OFFSET, self.seq + 1)
+        self.buf[BODY_OFFSET:STATE_SIZE] = bytes(STATE_SIZE - BODY_OFFSET)
+        PREAMBLE.pack_into(self.buf, 0, MAGIC, VERSION, EVENT_SLOTS)
+        self.seq = (self.seq + 2) & 0xFFFFFFFF
+        SEQ.pack_into(self.buf, SEQ_OFFSET, self.seq)
+
+        self._lock = threading.Lock()
+        self.layer = 0
+        self.held = 0
+        self.note_on_count = 0
+        self.note_off_count = 0
+        self.keystrokes = 0
+        self.layer_switches = 0
+        self.events = 0
+
+    def _publish(self, kind, note=0, velocity=0, keyname=""):
+        # 调用方已持有锁：在 seqlock 保护下写入事件与最新状态
+        SEQ.pack_into(self.buf, SEQ_OFFSET, self.seq + 1)
+        EVENT.pack_into(self.buf, EVENTS_OFFSET + (self.events % EVENT_SLOTS) * EVENT.size,
+                        _now_us(), kind, note, velocity, _encode_key(keyname))
+        self.events += 1
+        BODY.pack_into(self.buf, BODY_OFFSET, self.layer,
+                       self.held & MASK64, self.held >> 64,
+                       self.note_on_count, self.note_off_count, self.keystrokes, self.layer_switches,
+                       self.events)
+        self.seq = (self.seq + 2) & 0xFFFFFFFF
+        SEQ.pack_into(self.buf, SEQ_OFFSET, self.seq)
+
+    def note_on(self, note, velocity, keyname=None):
+        with self._lock:
+            self.held |= 1 << note
+            self.note_on_count += 1
+            if keyname is not None:
+                self.keystrokes += 1
+            self._publish(EVENT_NOTE_ON, note, velocity, keyname or "")
+
+    def note_off(self, note):
+        with self._lock:
+            self.held &= ~(1 << note)
+            self.note_off_count += 1
+            self._publish(EVENT_NOTE_OFF, note)
+
+    def set_layer(self, group):
+        with self._lock:
+            self.layer = LAYERS.index(group)
+            self.layer_switches += 1
+            self._publish(EVENT_LAYER, self.layer, 0, group)
+
+    def close(self):
+        self.buf.close()
+        os.close(self._fd)
+
+
+class StateBusReader:
+    """状态读取端：read() 返回一份一致的状态快照"""
+
+    def __init__(self, path=DEFAULT_PATH):
+        self._file = open(path, "rb")
+        self.buf = mmap.mmap(self._file.fileno(), STATE_SIZE, access=mmap.ACCESS_READ)
+        magic, version, slots = PREAMBLE.unpack_from(self.buf, 0)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f"不是 MidiType 状态文件或版本不兼容: {path}")
+        self.slots = slots
+
+    def read_raw(self, retries=1000):
+        # seqlock 读取：seq 为奇数（正在写）或前后不一致（读取期间被改写）时重试
+        for _ in range(retries):
+            seq1 = SEQ.unpack_from(self.buf, SEQ_OFFSET)[0]
+            if seq1 & 1:
+                continue
+            data = self.buf[:STATE_SIZE]
+            if SEQ.unpack_from(self.buf, SEQ_OFFSET)[0] == seq1:
+                return seq1, data
+        raise TimeoutError("状态文件持续被改写，读取失败")
+
+    def read(self, last_events=None):
+        """返回状态字典：held_notes、layer、计数器与最近的事件（按时间从旧到新）"""
+        seq, data = self.read_raw()
+        (layer, held_lo, held_hi, note_on_count, note_off_count,
+         keystrokes, layer_switches, total) = BODY.unpack_from(data, BODY_OFFSET)
+        held = held_lo | (held_hi << 64)
+        count = min(total, self.slots, last_events or self.slots)
+        events = []
+        for i in range(total - count, total):
+            ts, kind, note, velocity, key = EVENT.unpack_from(data, EVENTS_OFFSET + (i % self.slots) * EVENT.size)
+            events.append({"time_us": ts, "type": kind, "note": note, "velocity": velocity,
+                           "key": key.rstrip(b"\0").decode("utf-8", "ignore")})
+        return {
+            "seq": seq,
+            "layer": LAYERS[layer] if layer < len(LAYERS) else layer,
+            "held_notes": [n for n in range(128) if held >> n & 1],
+            "note_on": note_on_count,
+            "note_off": note_off_count,
+            "keystrokes": keystrokes,
+            "layer_switches": layer_switches,
+            "events": events,
+        }
+
+    def close(self):
+        self.buf.close()
+        self._file.close()
+
+
+def init_state_bus(options):
+    """根据 config.json 中的 "state_bus" 配置创建全局发布实例"""
+    global bus
+    if not options.get("enabled", False):
+        return None
+    path = options.get("path") or DEFAULT_PATH
+    try:
+        bus = StateBusPublisher(path)
+        print(f"📡 状态总线已启用: {path}")
+    except OSError as e:
+        print(f"❌ 状态总线启动失败: {e}")
+    return bus
+
+
+if __name__ == "__main__":
+    # 示例读取器：每 100 毫秒打印一次当前状态
+    reader = StateBusReader(sys.argv[1] if len(sys.argv) > 1 else DEFAULT_PATH)
+    last_seq = None
+    try:
+        while True:
+            state = reader.read(last_events=5)
+            if state["seq"] != last_seq:
+                last_seq = state["seq"]
+                recent = " ".join(f"{e['note']}:{e['key'] or '-'}" for e in state["events"] if e["type"] == EVENT_NOTE_ON)
+                print(f"[{state['layer']}] 按下 {state['held_notes']} | note_on {state['note_on']} "
+                      f"按键 {state['keystrokes']} | 最近 {recent}")
+            time.sleep(0.1)
+    except KeyboardInterrupt:
+        reader.close()
@@ -5,7 +5,7 @@ from PyQt5.QtWidgets import (
     QWidget, QSystemTrayIcon, QMenu, QAction, QMessageBox, QCheckBox, QComboBox
 )
 from PyQt5.QtGui import QIcon
-from PyQt5.QtCore import Qt
+from PyQt5.QtCore import Qt, QTimer
 import sys
 import os
 from app_state import app_state
@@ -16,6 +16,8 @@ from gui import piano_overlay_instance # Import the global instance file
 
 # 导入音频播放器相关功能
 from core.audio_player import get_available_sound_packs, change_sound_pack
+from utils.profiler import SamplingProfiler
+from utils.config_loader import settings
 
 class MainWindow(QMainWindow):
     def __init__(self):
@@ -66,6 +68,13 @@ class MainWindow(QMainWindow):
             # 添加所有可用的音色到下拉菜单
             for pack in self.sound_packs:
                 self.instrument_select.addItem(pack['name'])
+
+            # 恢复上次选择的音色（在连接信号之前设置，避免重复加载）
+            current = str(app_state.get("instrument", "")).lower()
+            for i, pack in enumerate(self.sound_packs):
+                if pack['name'].lower() == current:
+                    self.instrument_select.setCurrentIndex(i)
+                    break
             
             # 设置选中项并连接信号
             self.instrument_select.currentIndexChanged.connect(self.change_instrument)
@@ -85,6 +94,14 @@ class MainWindow(QMainWindow):
         show_action.triggered.connect(self.show)
         quit_action.triggered.connect(QApplication.quit)
         tray_menu.addAction(show_action)
+
+        # 性能采样开关：勾选后在指定秒数内采样 MIDI、连发与 GUI 线程，结束后自动取消勾选
+        self.profiler = None
+        self.profile_action = QAction("性能采样", self)
+        self.profile_action.setCheckable(True)
+        self.profile_action.toggled.connect(self.toggle_profiler)
+        tray_menu.addAction(self.profile_action)
+
         tray_menu.addAction(quit_action)
         self.tray_icon.setContextMenu(tray_menu)
         self.tray_icon.show()
@@ -100,11 +117,13 @@ class MainWindow(QMainWindow):
     def toggle_repeat(self, checked):
         # 更新全局状态中的按键连发功能
         app_state["repeat_enabled"] = checked
+        settings.set("repeat_enabled", checked)
         print(f"按键连发功能 {'开启' if checked else '关闭'}")
 
     def toggle_music_mode(self, checked):
         # 更新全局状态中的音乐模式标志
         app_state["music_mode"] = checked
+        settings.set("music_mode", checked)
         print(f"音乐模式 {'开启' if checked else '关闭'}")
 
     def change_instrument(self, index):
@@ -121,10 +140,41 @@ class MainWindow(QMainWindow):
         
         # 切换音色包并加载新音频
         if change_sound_pack(sound_path):
+            settings.set("instrument", instrument_name)
             print(f"已切换音色: {instrument_name}")
         else:
             print(f"切换音色失败: {instrument_name}")
 
+    def toggle_profiler(self, checked):
+        # 开始采样；采样进行中时无法提前取消，只会在结束后自动取消勾选
+        if not checked:
+            if self.profiler and self.profiler.is_running():
+                self.profile_action.blockSignals(True)
+                self.profile_action.setChecked(True)
+                self.profile_action.blockSignals(False)
+            return
+        seconds = app_state.get("profile_seconds", 10)
+        self.profiler = SamplingProfiler(duration=seconds)
+        self.profiler.start()
+        self.profile_action.setText(f"性能采样（进行中，{seconds} 秒）")
+        print(f"🔬 开始性能采样，持续 {seconds} 秒")
+        QTimer.singleShot(int(seconds * 1000) + 500, self.on_profiler_finished)
+
+    def on_profiler_finished(self):
+        # 采样线程可能仍在写文件，稍后再检查
+        if self.profiler.is_running():
+            QTimer.singleShot(200, self.on_profiler_finished)
+            return
+        self.profile_action.setText("性能采样")
+        self.profile_action.setChecked(False)
+        if self.profiler.output_path:
+            self.tray_icon.showMessage(
+                "MIDIType 性能采样完成",
+                f"结果已写入 {self.profiler.output_path}",
+                QSystemTrayIcon.Information,
+                3000
+            )
+
     def open_mapping_editor(self):
         QMessageBox.information(self, "提示", "这里将打开映射编辑器（待实现）")
 
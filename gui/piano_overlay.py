@@ -1,16 +1,23 @@
 """该模块用于实现钢琴键盘的覆盖窗口（PianoOverlay），
 用于在屏幕上显示虚拟钢琴键盘，展示当前按下的音符以及映射标签。
 它支持多种主题、透明度调节和工具栏控制，由 PyQt5 实现。
+
+琴键尺寸随窗口大小与设备像素比缩放，可显示任意音符范围（包括完整的 88 键）。
+琴键布局只在窗口大小或音符范围变化时重新计算；未按下状态的整个键盘缓存为一张位图，
+每次重绘只需贴图并绘制按下的琴键，重绘开销与显示的琴键数量无关。
 """
 import json, os
 from PyQt5.QtWidgets import (
-    QWidget, QVBoxLayout, QHBoxLayout, QPushButton, QLabel,
-    QSlider, QToolButton, QFrame, QColorDialog
+    QApplication, QWidget, QVBoxLayout, QHBoxLayout, QPushButton, QLabel,
+    QSlider, QToolButton, QFrame, QColorDialog, QSizeGrip
 )
-from PyQt5.QtCore import Qt, QPoint
-from PyQt5.QtGui import QPainter, QColor, QFont
+from PyQt5.QtCore import Qt, QPoint, QRectF
+from PyQt5.QtGui import QPainter, QColor, QFont, QPixmap
 
 from app_state import app_state
+from utils.config_loader import settings
+import core.completion
+from core.mapping_manager import build_label_table, note_range
 
 NOTE_NAMES = ["C", "C#", "D", "D#", "E", "F", "F#", "G", "G#", "A", "A#", "B"]
 
@@ -18,6 +25,11 @@ NOTE_NAMES = ["C", "C#", "D", "D#", "E", "F", "F#", "G", "G#", "A", "A#", "B"]
 def is_black(note):
     return note % 12 in [1, 3, 6, 8, 10]
 
+# 琴键尺寸比例（以白键宽度为基准）
+WHITE_KEY_ASPECT = 4.0     # 白键高度 / 白键宽度
+BLACK_KEY_WIDTH = 0.6      # 黑键宽度 / 白键宽度
+BLACK_KEY_HEIGHT = 0.625   # 黑键高度 / 白键高度
+
 # 定义特殊符号映射，用于将特定按键名称转换为对应的显示符号
 SPECIAL_SYMBOLS = {
     "enter": "↵",
@@ -30,25 +42,45 @@ SPECIAL_SYMBOLS = {
 
 class PianoOverlay(QWidget):
     """该类实现了一个虚拟钢琴键盘覆盖窗口，具备以下功能：
-    - 显示从 start_note 到 end_note 的琴键（包括白键和黑键）
+    - 显示从 start_note 到 end_note 的琴键（包括白键和黑键），未指定时根据已加载的映射自动推导
+    - 琴键尺寸随窗口缩放，右下角可拖动调整大小
     - 高亮显示当前活动的音符
     - 支持切换主副映射，显示不同的标签组合
     - 提供工具栏，用于调节透明度、主题设置及其他操作
     """
-    def __init__(self, start_note=48, end_note=84, key_width=40):
+    def __init__(self, start_note=None, end_note=None, key_width=40):
         # 构造函数：初始化窗口属性、加载主题、构建标签以及设置工具栏
+        # key_width 为默认的白键宽度（逻辑像素），实际尺寸随窗口大小缩放
         super().__init__()
         self.setWindowTitle("虚拟钢琴键盘")
         self.setWindowFlags(Qt.Tool | Qt.FramelessWindowHint | Qt.WindowStaysOnTopHint)
         self.setAttribute(Qt.WA_TranslucentBackground)
 
+        # 从内存中的设置恢复上次的主题、透明度、自定义颜色、位置与大小
+        saved = settings.get("overlay", {})
+
+        if start_note is None or end_note is None:
+            start_note, end_note = self.default_note_range(saved)
         self.start_note = start_note
         self.end_note = end_note
         self.key_width = key_width
-        self.black_key_width = int(key_width * 0.6)
-        self.white_key_height = 160
-        self.black_key_height = 100
-        self.opacity = 0.92
+        # 启用单词补全时，在琴键下方留出候选栏
+        self.suggestion_height = 24 if core.completion.engine is not None else 0
+        self.suggestions = []
+
+        # 布局缓存：由 rebuild_layout 在窗口大小或音符范围变化时计算
+        self.white_key_width = float(key_width)
+        self.white_key_height = key_width * WHITE_KEY_ASPECT
+        self.black_key_width = key_width * BLACK_KEY_WIDTH
+        self.black_key_height = self.white_key_height * BLACK_KEY_HEIGHT
+        self.key_rects = {}        # 音符 → QRectF
+        self.white_keys = []       # 按从左到右顺序的白键音符
+        self.black_keys = []
+        self.black_neighbors = {}  # 白键音符 → 与其重叠的黑键音符（高亮白键后需重画）
+        self.label_fonts = (QFont("Arial", 10), QFont("Arial", 9))
+        self._keyboard_cache = {}  # 映射组 → 未按下状态的键盘位图
+
+        self.opacity = saved.get("opacity", 0.92)
         self.setWindowOpacity(self.opacity)
 
         self.active_notes = set()
@@ -57,7 +89,10 @@ class PianoOverlay(QWidget):
         self.toolbar_visible = True
 
         self.load_themes()
-        self.current_theme = "normal"
+        self.themes["custom"].update(saved.get("custom", {}))
+        self.current_theme = saved.get("theme", "normal")
+        if self.current_theme not in self.themes:
+            self.current_theme = "normal"
 
         # 新增：主副映射标注组
         self.labels_main = {}
@@ -70,7 +105,34 @@ class PianoOverlay(QWidget):
         self.toolbar.move(0, 0)
         self.toolbar.show()
 
-        self.resize(self.calculate_width(), self.white_key_height)
+        # 右下角的尺寸手柄，用于缩放窗口
+        self.size_grip = QSizeGrip(self)
+        self.size_grip.resize(16, 16)
+        self.setMinimumSize(120, 40 + self.suggestion_height)
+
+        if "width" in saved and "height" in saved:
+            self.resize(saved["width"], saved["height"])
+        else:
+            self.resize(*self.default_size())
+        if "x" in saved and "y" in saved:
+            self.move(saved["x"], saved["y"])
+        self.rebuild_layout()
+
+    def default_note_range(self, saved):
+        # 显示范围：优先使用设置中指定的范围，否则根据主副映射与补全接受键推导
+        if "start_note" in saved and "end_note" in saved:
+            return saved["start_note"], saved["end_note"]
+        extra = [core.completion.engine.accept_note] if core.completion.engine is not None else []
+        return note_range([app_state.get("main_mapping", {}), app_state.get("alt_mapping", {})], extra)
+
+    def default_size(self):
+        # 默认按 key_width 计算大小；超出屏幕可用宽度时等比缩小以适应屏幕
+        width = self.count_white_keys() * self.key_width
+        screen = QApplication.primaryScreen()
+        if screen is not None:
+            width = min(width, int(screen.availableGeometry().width() * 0.95))
+        white_width = width / max(self.count_white_keys(), 1)
+        return int(width), int(white_width * WHITE_KEY_ASPECT) + self.suggestion_height
 
     def load_themes(self):
         # 从 JSON 文件中加载主题配置，并初始化默认和自定义主题
@@ -138,36 +200,97 @@ class PianoOverlay(QWidget):
             color = QColorDialog.getColor()
             if color.isValid():
                 self.themes["custom"][key] = color.name()
+        settings.update_section("overlay", custom=dict(self.themes["custom"]))
         self.set_theme("custom")
 
     def toggle_labels(self):
         # 切换是否在琴键上显示映射标签
         self.show_labels = not self.show_labels
-        self.update()
+        self.invalidate_cache()
 
     def set_theme(self, name):
         # 设置当前使用的主题，并刷新界面显示
         self.current_theme = name
-        self.update()
+        settings.update_section("overlay", theme=name)
+        self.invalidate_cache()
 
     def set_opacity(self, value):
         # 设置窗口透明度
         self.opacity = value
         self.setWindowOpacity(value)
+        settings.update_section("overlay", opacity=value)
+
+    def count_white_keys(self):
+        # 统计范围内的白键数量（每个八度 7 个白键，按整八度与余数计算，无需逐个遍历）
+        def whites_below(note):
+            octaves, rem = divmod(note, 12)
+            return octaves * 7 + (rem + (rem > 4) + 1) // 2
+        return whites_below(self.end_note + 1) - whites_below(self.start_note)
+
+    def set_note_range(self, start_note, end_note):
+        # 修改显示的音符范围：重新生成标签与布局
+        self.start_note, self.end_note = start_note, end_note
+        settings.update_section("overlay", start_note=start_note, end_note=end_note)
+        self.build_labels()
+        self.rebuild_layout()
+
+    def rebuild_layout(self):
+        # 根据窗口大小计算每个琴键的矩形与标签字体，只在窗口大小或音符范围变化时调用
+        keys_height = max(self.height() - self.suggestion_height, 1)
+        self.white_key_width = self.width() / max(self.count_white_keys(), 1)
+        self.white_key_height = keys_height
+        self.black_key_width = self.white_key_width * BLACK_KEY_WIDTH
+        self.black_key_height = keys_height * BLACK_KEY_HEIGHT
+
+        self.key_rects = {}
+        self.white_keys = []
+        self.black_keys = []
+        x = 0.0
+        for n in range(self.start_note, self.end_note + 1):
+            if is_black(n):
+                left = x - self.black_key_width / 2
+                self.key_rects[n] = QRectF(left, 0, self.black_key_width, self.black_key_height)
+                self.black_keys.append(n)
+            else:
+                self.key_rects[n] = QRectF(x, 0, self.white_key_width, self.white_key_height)
+                self.white_keys.append(n)
+                x += self.white_key_width
+        self.black_neighbors = {
+            n: [b for b in (n - 1, n + 1) if b in self.key_rects and is_black(b)]
+            for n in self.white_keys
+        }
+
+        # 标签字号随琴键宽度缩放
+        size = min(max(self.white_key_width * 0.25, 6.0), 14.0)
+        white_font = QFont("Arial")
+        white_font.setPointSizeF(size)
+        black_font = QFont("Arial")
+        black_font.setPointSizeF(max(size * 0.9, 5.0))
+        self.label_fonts = (white_font, black_font)
+        self.invalidate_cache()
+
+    def invalidate_cache(self):
+        # 主题、标签或布局变化后，丢弃键盘位图缓存并重绘
+        self._keyboard_cache = {}
+        self.update()
 
-    def calculate_width(self):
-        # 根据定义的起始和结束音符（仅计白键）来计算窗口宽度
-        return len([n for n in range(self.start_note, self.end_note + 1) if not is_black(n)]) * self.key_width
+    def resizeEvent(self, event):
+        self.size_grip.move(self.width() - self.size_grip.width(), self.height() - self.size_grip.height())
+        self.rebuild_layout()
+        settings.update_section("overlay", width=self.width(), height=self.height())
+        super().resizeEvent(event)
 
     def build_labels(self):
         # 生成琴键上的映射标签，基于 app_state 中的主映射和备用映射数据
-        main_map = app_state.get("main_mapping", {})
-        alt_map = app_state.get("alt_mapping", {})
+        # 每个标签为 (轻按标签, 重按标签)，没有力度分层时重按标签为空
+        threshold = app_state.get("velocity_threshold", 80)
+        main_labels = build_label_table(app_state.get("main_mapping", {}), SPECIAL_SYMBOLS, threshold)
+        alt_labels = build_label_table(app_state.get("alt_mapping", {}), SPECIAL_SYMBOLS, threshold)
+        self.labels_main = {}
+        self.labels_alt = {}
         for note in range(self.start_note, self.end_note + 1):
-            m = main_map.get(str(note), "")
-            a = alt_map.get(str(note), "")
-            self.labels_main[note] = SPECIAL_SYMBOLS.get(m.lower(), m)
-            self.labels_alt[note] = SPECIAL_SYMBOLS.get(a.lower(), a)
+            self.labels_main[note] = main_labels.get(note, ("", ""))
+            self.labels_alt[note] = alt_labels.get(note, ("", ""))
 
     def set_label_group(self, group):
         # 设置当前显示的标签组（'main' 或 'alt'），并刷新界面
@@ -175,6 +298,12 @@ class PianoOverlay(QWidget):
             self.active_label_group = group
             self.update()
 
+    def set_suggestions(self, words):
+        # 更新补全候选栏（候选未变化时不重绘）
+        if words != self.suggestions:
+            self.suggestions = list(words)
+            self.update()
+
     def note_on(self, note):
         # 当音符按下时，记录该音符并刷新界面以高亮显示对应琴键
         print(f"🎹 note_on 被调用，音符: {note}")
@@ -198,54 +327,90 @@ class PianoOverlay(QWidget):
             self.move(event.globalPos() - self._drag_pos)
 
     def mouseReleaseEvent(self, event):
-        # 鼠标释放事件：当工具栏隐藏且点击左上角特定区域时，显示工具栏
+        # 鼠标释放事件：拖动结束时记录窗口位置；当工具栏隐藏且点击左上角特定区域时，显示工具栏
+        if self._drag_pos is not None:
+            self._drag_pos = None
+            settings.update_section("overlay", x=self.x(), y=self.y())
         if not self.toolbar_visible and event.pos().x() <= 30 and event.pos().y() <= 20:
             self.toggle_toolbar()
 
+    def draw_key(self, painter, note, theme, active):
+        # 绘制单个琴键及其映射标签
+        rect = self.key_rects[note]
+        black = is_black(note)
+        if active:
+            painter.setBrush(QColor(theme["highlight"]))
+        else:
+            painter.setBrush(QColor(theme["black"] if black else theme["white"]))
+        painter.setPen(Qt.NoPen if black else QColor(0, 0, 0))
+        painter.drawRect(rect)
+
+        if self.show_labels:
+            soft, hard = self.labels_main[note] if self.active_label_group == "main" else self.labels_alt[note]
+            if not soft and not hard:
+                return
+            font = self.label_fonts[1 if black else 0]
+            line = font.pointSizeF() * 1.6
+            painter.setFont(font)
+            painter.setPen(QColor(255, 255, 255) if black else QColor(0, 0, 0))
+            x = rect.left() + rect.width() * (0.1 if black else 0.15)
+            y = rect.top() + rect.height() * (0.55 if black else 0.8)
+            painter.drawText(int(x), int(y), soft)
+            if hard:
+                # 力度分层：重按标签显示在轻按标签上方
+                painter.drawText(int(x), int(y - line), hard)
+
+    def render_keyboard(self, theme):
+        # 把未按下状态的整个键盘渲染为位图，按设备像素比创建以保证高分屏清晰
+        ratio = self.devicePixelRatioF()
+        pixmap = QPixmap(int(self.width() * ratio), int(self.white_key_height * ratio) + 1)
+        pixmap.setDevicePixelRatio(ratio)
+        pixmap.fill(Qt.transparent)
+        painter = QPainter(pixmap)
+        painter.setRenderHint(QPainter.Antialiasing)
+        for n in self.white_keys:
+            self.draw_key(painter, n, theme, False)
+        for n in self.black_keys:
+            self.draw_key(painter, n, theme, False)
+        painter.end()
+        return pixmap
+
     def paintEvent(self, event):
-        # 重绘窗口：根据当前状态绘制白键、黑键及映射标签，展现按键高亮效果
+        # 重绘窗口：贴上缓存的键盘位图，再只绘制按下的琴键（高亮），开销与琴键总数无关
         painter = QPainter(self)
         painter.setRenderHint(QPainter.Antialiasing)
         theme = self.themes[self.current_theme]
 
-        white_notes = []
-        black_notes = []
-        for n in range(self.start_note, self.end_note + 1):
-            (black_notes if is_black(n) else white_notes).append(n)
-
-        note_to_x = {}
-        x = 0
-        for n in white_notes:
-            note_to_x[n] = x
-            color = QColor(theme["highlight"]) if n in self.active_notes else QColor(theme["white"])
-            painter.setBrush(color)
+        # 每个映射组各缓存一张位图，踏板切换映射组时无需重新渲染；移动到不同像素比的屏幕时重新渲染
+        cache = self._keyboard_cache.get(self.active_label_group)
+        if cache is None or cache.devicePixelRatioF() != self.devicePixelRatioF():
+            cache = self._keyboard_cache[self.active_label_group] = self.render_keyboard(theme)
+        painter.drawPixmap(0, 0, cache)
+
+        # MIDI 线程会同时修改 active_notes，先取一份快照（tuple() 在一次调用内完成拷贝），避免迭代时集合大小改变
+        notes = frozenset(tuple(self.active_notes))
+        active = [n for n in notes if n in self.key_rects]
+        for n in active:
+            if not is_black(n):
+                self.draw_key(painter, n, theme, True)
+        # 高亮的白键会盖住相邻黑键，需重画这些黑键
+        redraw = {n for n in active if is_black(n)}
+        for n in active:
+            if not is_black(n):
+                redraw.update(self.black_neighbors[n])
+        for n in redraw:
+            self.draw_key(painter, n, theme, n in notes)
+
+        if self.suggestion_height:
+            # 补全候选栏：第一个候选即为接受键输出的单词
+            top = int(self.white_key_height)
+            painter.setBrush(QColor(theme["toolbar"]))
+            painter.setPen(Qt.NoPen)
+            painter.drawRect(0, top, self.width(), self.suggestion_height)
             painter.setPen(QColor(0, 0, 0))
-            painter.drawRect(x, 0, self.key_width, self.white_key_height)
-
-            if self.show_labels:
-                label = self.labels_main[n] if self.active_label_group == "main" else self.labels_alt[n]
-                painter.setPen(QColor(0, 0, 0))
-                font = QFont("Arial", 10)
-                painter.setFont(font)
-                painter.drawText(x + 6, int(self.white_key_height * 0.8), label)
-
-            x += self.key_width
-
-        for n in black_notes:
-            prev_white = n - 1
-            if prev_white in note_to_x:
-                x = note_to_x[prev_white] + self.key_width - self.black_key_width // 2
-                color = QColor(theme["highlight"]) if n in self.active_notes else QColor(theme["black"])
-                painter.setBrush(color)
-                painter.setPen(Qt.NoPen)
-                painter.drawRect(x, 0, self.black_key_width, self.black_key_height)
-
-                if self.show_labels:
-                    label = self.labels_main[n] if self.active_label_group == "main" else self.labels_alt[n]
-                    painter.setPen(QColor(255, 255, 255))
-                    font = QFont("Arial", 9)
-                    painter.setFont(font)
-                    painter.drawText(x + 3, int(self.black_key_height / 2 + 5), label)
+            painter.setFont(QFont("Arial", 10))
+            text = "   ".join(f"{i}. {w}" for i, w in enumerate(self.suggestions, 1))
+            painter.drawText(8, top + self.suggestion_height - 7, text)
 
         if not self.toolbar_visible:
             painter.setPen(QColor(100, 100, 100))
@@ -9,17 +9,40 @@ import json, threading, mido
 from time import sleep
 from pynput.keyboard import Controller
 from app_state import app_state
-from utils.config_loader import load_config
+from utils.config_loader import load_config, settings
 from core.midi_dispatcher import handle_midi
-from core.audio_player import get_available_sound_packs, change_sound_pack
+from core.mapping_manager import build_key_table
+from core.midi_filter import build_pipeline
+from core.net_transport import NetReceiver
+from core.completion import init_completion, shutdown_completion
+from core.state_bus import init_state_bus
+from utils.profiler import StallWatchdog
+from core.audio_player import get_available_sound_packs, init_audio, shutdown_audio
 
 from PyQt5.QtWidgets import QApplication
+from PyQt5.QtCore import Qt
 from gui.main_window import MainWindow
 from gui.piano_overlay import PianoOverlay
 from gui import piano_overlay_instance
 import sys
 
-def midi_listener():
+# 本地 MIDI 线程与网络接收线程共用同一个分发入口，用锁保证消息逐条处理
+dispatch_lock = threading.Lock()
+
+def make_dispatcher(accept):
+    # accept 为 build_pipeline 生成的预处理函数，被拒绝的消息不会进入 handle_midi；
+    # force=True 用于网络超时等补发的松开：仍经过 accept 以更新过滤状态，但无论结果如何都会释放按键
+    def dispatch(msg, force=False):
+        with dispatch_lock:
+            if not accept(msg) and not force:
+                return
+            handle_midi(msg,
+                        repeat_enabled=app_state.get("repeat_enabled", True),
+                        repeat_delay=app_state.get("repeat_delay", 0.35),
+                        repeat_rate=app_state.get("repeat_rate", 10.0))
+    return dispatch
+
+def midi_listener(dispatch):
     # 此函数用于监听 MIDI 输入设备，读取并处理每条 MIDI 消息
     try:
         names = mido.get_input_names()  # 获取系统中的 MIDI 设备名称列表
@@ -30,11 +53,8 @@ def midi_listener():
         print("🎧 正在监听 MIDI 设备: ", names[0])
         with mido.open_input(names[0]) as inport:
             for msg in inport:
-                # 对每条 MIDI 消息调用 handle_midi 进行处理
-                handle_midi(msg,
-                            repeat_enabled=app_state.get("repeat_enabled", True),
-                            repeat_delay=app_state.get("repeat_delay", 0.35),
-                            repeat_rate=app_state.get("repeat_rate", 10.0))
+                # 对每条 MIDI 消息调用 dispatch（预处理 + handle_midi）进行处理
+                dispatch(msg)
     except Exception as e:
         print(f"❌ MIDI 错误: {e}")
 
@@ -53,9 +73,13 @@ if __name__ == "__main__":
     with open(config["alt_mapping_path"], "r", encoding="utf-8") as f:
         alt_mapping = json.load(f)
 
+    # 编译 [音符][力度] → 键名 查找表（力度分层的阈值默认取 velocity_threshold）
+    velocity_threshold = config.get("velocity_threshold", 80)
+
     # === 初始化音色 ===
     # 扫描可用音色包
     sound_packs = get_available_sound_packs()
+    selected_pack = None
     if sound_packs:
         # 如果配置中指定了乐器名称，尝试找到对应的音色包
         configured_instrument = config.get("instrument", "")
@@ -72,13 +96,15 @@ if __name__ == "__main__":
         if not selected_pack and sound_packs:
             selected_pack = sound_packs[0]
         
-        # 应用选中的音色包
         if selected_pack:
-            change_sound_pack(selected_pack['path'])
             print(f"初始化音色: {selected_pack['name']}")
     else:
         print("警告: 未找到可用的音色包")
 
+    # 应用选中的音色包：在本进程内加载，或交给独立音频进程（audio_process）
+    init_audio(selected_pack['path'] if selected_pack else None,
+               use_process=config.get("audio_process", False))
+
     # 初始化全局应用状态，将配置参数、键盘控制对象和映射关系保存到 app_state 中
     app_state.update({
         "music_mode": config.get("music_mode", True),
@@ -87,15 +113,35 @@ if __name__ == "__main__":
         "current_mapping_name": "main",
         "main_mapping": main_mapping,
         "alt_mapping": alt_mapping,
+        "main_keys": build_key_table(main_mapping, velocity_threshold),
+        "alt_keys": build_key_table(alt_mapping, velocity_threshold),
+        "velocity_threshold": velocity_threshold,
         "keyboard": Controller(),
         "repeat_threads": {},
         "repeat_enabled": repeat_enabled,
         "repeat_delay": repeat_delay,
-        "repeat_rate": repeat_rate
+        "repeat_rate": repeat_rate,
+        "profile_seconds": config.get("profile_seconds", 10)
     })
 
+    # 共享内存状态总线：供外部工具读取按下的音符、映射组与最近事件
+    init_state_bus(config.get("state_bus", {}))
+
+    # 加载单词补全索引（需在创建 piano_overlay 之前，以便预留候选栏）
+    init_completion(config.get("completion", {}))
+
     # 创建 PyQt5 应用对象，并构造程序主窗口
+    # 启用高分屏缩放（必须在创建 QApplication 之前设置）
+    QApplication.setAttribute(Qt.AA_EnableHighDpiScaling)
+    QApplication.setAttribute(Qt.AA_UseHighDpiPixmaps)
     app = QApplication(sys.argv)
+    app.aboutToQuit.connect(shutdown_audio)
+    app.aboutToQuit.connect(settings.flush)
+    app.aboutToQuit.connect(shutdown_completion)
+
+    # 启动 Qt 事件循环卡顿检测，超过阈值时记录 GUI 线程调用栈
+    stall_watchdog = StallWatchdog(threshold=config.get("stall_threshold_ms", 250) / 1000)
+    stall_watchdog.start()
 
     window = MainWindow()
     window.show()
@@ -105,7 +151,22 @@ if __name__ == "__main__":
     piano_overlay_instance.piano_overlay.show()
 
     # 启动一个后台线程，持续监听 MIDI 设备发送的消息
-    threading.Thread(target=midi_listener, daemon=True).start()
+    dispatch = make_dispatcher(build_pipeline(config.get("midi_filter"), config.get("pedal_control", 64)))
+    threading.Thread(target=midi_listener, args=(dispatch,), name="MidiListener", daemon=True).start()
+
+    # 网络模式：接收远程发送端转发的 MIDI 事件，超时后只释放来自网络的按键
+    network = config.get("network", {})
+    if network.get("receive", False):
+        try:
+            net_receiver = NetReceiver(dispatch,
+                                       host=network.get("host", "0.0.0.0"),
+                                       port=network.get("port", 9123),
+                                       timeout=network.get("timeout", 1.0),
+                                       allowed_sender=network.get("allowed_sender"),
+                                       on_release=lambda msg: dispatch(msg, force=True))
+            net_receiver.start()
+        except OSError as e:
+            print(f"❌ 网络 MIDI 接收端启动失败: {e}")
     print("✅ MIDI 模拟器后台线程已启动（组合键 + 自动连发）")
 
     # 进入 Qt 事件循环，等待用户与程序界面的交互
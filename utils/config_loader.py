@@ -2,6 +2,10 @@
 
 import json
 import os
+import stat
+import tempfile
+import threading
+import time
 from app_state import app_state
 
 DEFAULT_CONFIG = {
@@ -13,17 +17,23 @@ DEFAULT_CONFIG = {
 }
 
 def load_config(filepath="config.json"):
+    writable = True
     if not os.path.exists(filepath):
         print("⚠️ config.json 未找到，使用默认配置")
-        config = DEFAULT_CONFIG
+        config = dict(DEFAULT_CONFIG)
         save_config(filepath, config)
     else:
         try:
             with open(filepath, "r", encoding="utf-8") as f:
                 config = json.load(f)
         except Exception as e:
-            print(f"❌ 配置文件读取失败：{e}")
-            config = DEFAULT_CONFIG
+            # 读取失败的文件可能只是手误（如多了注释或逗号），不能用默认配置覆盖它
+            print(f"❌ 配置文件读取失败：{e}，本次运行使用默认配置，界面修改的设置不会写回")
+            config = dict(DEFAULT_CONFIG)
+            writable = False
+
+    # 记录到设置存储中，界面修改的设置会在此基础上写回
+    settings.load(filepath, config, writable)
 
     # 同步 app_state
     app_state["music_mode"] = config.get("music_mode", True)
@@ -33,4 +43,109 @@ def load_config(filepath="config.json"):
     return config  # ✅ 一定要有这一句！
 
 def save_config(filepath="config.json", config_dict=None):
-    ...
+    # 原子写入：先写同目录下的临时文件，再用 os.replace 替换，避免写到一半时退出导致配置损坏
+    if config_dict is None:
+        config_dict = settings.snapshot()
+    directory = os.path.dirname(os.path.abspath(filepath))
+    fd, tmp_path = tempfile.mkstemp(prefix=".config-", suffix=".tmp", dir=directory)
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump(config_dict, f, ensure_ascii=False, indent=2)
+            f.flush()
+            os.fsync(f.fileno())
+        # mkstemp 创建的临时文件权限为 0600，替换前沿用原文件的权限，避免悄悄改变 config.json 的权限
+        if os.path.exists(filepath):
+            os.chmod(tmp_path, stat.S_IMODE(os.stat(filepath).st_mode))
+        os.replace(tmp_path, filepath)
+    except Exception as e:
+        print(f"❌ 配置文件保存失败：{e}")
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+
+class SettingsStore:
+    """界面修改的设置：先记录在内存中，再由后台线程防抖后写回 config.json
+
+    连续修改（如拖动透明度滑块）只会在最后一次修改 delay 秒后写一次文件。
+    读取设置只访问内存，不会重新读取文件。
+    配置文件存在但无法解析时以只读方式加载，修改只保留在内存中，不会覆盖原文件。
+    """
+
+    def __init__(self, delay=0.5):
+        self.delay = delay
+        self.filepath = "config.json"
+        self.data = {}
+        self.writable = True
+        self._lock = threading.Lock()
+        self._write_lock = threading.Lock()  # 串行化文件写入，避免较旧的快照覆盖较新的
+        self._pending = threading.Event()
+        self._deadline = 0.0
+        self._dirty = False
+        self._writer = None
+
+    def load(self, filepath, config, writable=True):
+        with self._lock:
+            self.filepath = filepath
+            self.writable = writable
+            self.data = json.loads(json.dumps(config))
+
+    def get(self, key, default=None):
+        return self.data.get(key, default)
+
+    def snapshot(self):
+        with self._lock:
+            return json.loads(json.dumps(self.data))
+
+    def set(self, key, value):
+        with self._lock:
+            if self.data.get(key) == value:
+                return
+            self.data[key] = value
+            self._schedule()
+
+    def update_section(self, section, **values):
+        # 更新嵌套设置，如 settings.update_section("overlay", theme="dark")
+        with self._lock:
+            current = self.data.setdefault(section, {})
+            if all(current.get(k) == v for k, v in values.items()):
+                return
+            current.update(values)
+            self._schedule()
+
+    def _schedule(self):
+        # 调用方已持有锁：推迟写入时间并唤醒后台写入线程
+        self._dirty = True
+        self._deadline = time.monotonic() + self.delay
+        if self._writer is None:
+            self._writer = threading.Thread(target=self._run, name="SettingsWriter", daemon=True)
+            self._writer.start()
+        self._pending.set()
+
+    def _run(self):
+        while True:
+            self._pending.wait()
+            self._pending.clear()
+            # 在最后一次修改后等待 delay 秒，期间的新修改会继续推迟写入
+            while True:
+                remaining = self._deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                time.sleep(remaining)
+            self.flush()
+
+    def flush(self):
+        # 立即写回未保存的修改（程序退出时调用）
+        # 后台线程与退出时的调用可能同时进入：持有写入锁期间取快照并写文件，
+        # 后进入的一方一定拿到更新的快照，且在先进入的一方写完后才写
+        with self._write_lock:
+            with self._lock:
+                if not self._dirty or not self.writable:
+                    return
+                self._dirty = False
+                data = json.loads(json.dumps(self.data))
+                filepath = self.filepath
+            save_config(filepath, data)
+
+# 全局设置存储实例
+settings = SettingsStore()
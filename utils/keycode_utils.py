@@ -29,8 +29,14 @@ REPEATABLE_KEYS = set(
 )
 
 def get_key_obj(keyname: str):
-    """将字符串键名映射为 pynput 可识别的 Key 对象或字符"""
-    return SPECIAL_KEYS.get(keyname.lower(), keyname.lower())
+    """将字符串键名映射为 pynput 可识别的 Key 对象或字符
+
+    单个字符保留大小写（如力度分层中的 "A"），其余键名按小写处理。
+    """
+    key = SPECIAL_KEYS.get(keyname.lower())
+    if key is not None:
+        return key
+    return keyname if len(keyname) == 1 else keyname.lower()
 
 def is_repeatable(keyname: str) -> bool:
     """判断该键是否支持自动重复输入"""
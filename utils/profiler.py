@@ -0,0 +1,136 @@
+# utils/profiler.py
+"""
+性能诊断工具，用于在用户机器上排查卡顿而无需附加调试器：
+- StallWatchdog: 检测 Qt 事件循环长时间未被处理（界面卡顿），并抓取此刻 GUI 线程的调用栈
+- SamplingProfiler: 在指定秒数内周期性采样 MIDI、连发与 GUI 线程的调用栈，
+  输出 collapsed-stack 格式文件（每行 "线程;帧1;帧2 次数"），可直接交给 flamegraph.pl / speedscope 生成火焰图
+"""
+
+import os
+import sys
+import threading
+import time
+import traceback
+from collections import Counter
+
+PROFILE_DIR = "profiles"
+
+# 参与采样的线程名前缀：GUI 主线程、MIDI 监听线程（本地与网络）与连发线程
+PROFILED_THREADS = ("MainThread", "MidiListener", "NetReceiver", "Repeat")
+
+
+def _ensure_dir():
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+
+
+def _frame_label(frame):
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})"
+
+
+class StallWatchdog:
+    """Qt 事件循环卡顿检测器
+
+    GUI 线程上的 QTimer 周期性刷新心跳时间戳，后台线程发现心跳超过 threshold 秒未更新时，
+    通过 sys._current_frames() 抓取 GUI 线程的调用栈并写入 profiles/stalls.log。
+    同一次卡顿只记录一次。
+    """
+
+    def __init__(self, threshold=0.25, interval=0.05):
+        self.threshold = threshold
+        self.interval = interval
+        self.gui_thread_id = threading.get_ident()
+        self.stall_count = 0
+        self._heartbeat = time.perf_counter()
+        self._timer = None
+        self._stopping = threading.Event()
+
+    def start(self):
+        # 必须在 GUI 线程、QApplication 创建之后调用
+        from PyQt5.QtCore import QTimer
+
+        self.gui_thread_id = threading.get_ident()
+        self._timer = QTimer()
+        self._timer.timeout.connect(self._beat)
+        self._timer.start(int(self.interval * 1000))
+        threading.Thread(target=self._watch, name="StallWatchdog", daemon=True).start()
+
+    def stop(self):
+        self._stopping.set()
+        if self._timer is not None:
+            self._timer.stop()
+
+    def _beat(self):
+        self._heartbeat = time.perf_counter()
+
+    def _watch(self):
+        reported = False
+        while not self._stopping.wait(self.interval):
+            stalled_for = time.perf_counter() - self._heartbeat
+            if stalled_for < self.threshold:
+                reported = False
+                continue
+            if reported:
+                continue
+            reported = True
+            self.stall_count += 1
+            frame = sys._current_frames().get(self.gui_thread_id)
+            stack = "".join(traceback.format_stack(frame)) if frame else "（无法获取 GUI 线程调用栈）\n"
+            print(f"⚠️ Qt 事件循环已卡顿 {stalled_for * 1000:.0f} ms，GUI 线程调用栈已记录到 {PROFILE_DIR}/stalls.log")
+            try:
+                _ensure_dir()
+                with open(os.path.join(PROFILE_DIR, "stalls.log"), "a", encoding="utf-8") as f:
+                    f.write(f"=== {time.strftime('%Y-%m-%d %H:%M:%S')} 卡顿 {stalled_for * 1000:.0f} ms ===\n")
+                    f.write(stack)
+            except OSError as e:
+                print(f"❌ 写入卡顿日志失败: {e}")
+
+
+class SamplingProfiler:
+    """多线程采样分析器：在 duration 秒内每 interval 秒采样一次目标线程的调用栈"""
+
+    def __init__(self, duration=10.0, interval=0.005, thread_prefixes=PROFILED_THREADS):
+        self.duration = duration
+        self.interval = interval
+        self.thread_prefixes = thread_prefixes
+        self.output_path = None
+        self.samples = 0
+        self._stacks = Counter()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="SamplingProfiler", daemon=True)
+        self._thread.start()
+
+    def is_running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def _run(self):
+        deadline = time.perf_counter() + self.duration
+        while time.perf_counter() < deadline:
+            names = {t.ident: t.name for t in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                name = names.get(ident, "")
+                if not name.startswith(self.thread_prefixes):
+                    continue
+                stack = []
+                while frame is not None:
+                    stack.append(_frame_label(frame))
+                    frame = frame.f_back
+                stack.append(name)
+                self._stacks[";".join(reversed(stack))] += 1
+            self.samples += 1
+            time.sleep(self.interval)
+        self._write()
+
+    def _write(self):
+        try:
+            _ensure_dir()
+            path = os.path.join(PROFILE_DIR, time.strftime("profile_%Y%m%d_%H%M%S.folded"))
+            with open(path, "w", encoding="utf-8") as f:
+                for stack, count in self._stacks.most_common():
+                    f.write(f"{stack} {count}\n")
+            self.output_path = path
+            print(f"✅ 性能采样完成（{self.samples} 次），结果已写入 {path}")
+        except OSError as e:
+            print(f"❌ 写入性能采样结果失败: {e}")